@@ -1,99 +1,504 @@
 #!/usr/bin/env python3
 
 from arm.helper_utils import *
+from isa.assembler import *
+from isa.computer import *
 
-class Computer:
-    def __init__(self):
-        pass
-
-class ArmInstruction:
-    def __init__(self):
-        self.h = 0x00000000       #Readonly value
-        self.s = "NOP;"           #Readonly value
-        self.parsed = ["NOP"]     #Readonly value
-
-    def fromHex(self, h):
-        self.parsed = ArmInstruction._parseFromHex(h)
-        self.s = ArmInstruction._generateStr(self.parsed)
-        self.h = h
-    
-    def fromStr(self, s):
-        self.parsed = ArmInstruction._parseFromStr(s)
-        self.h = ArmInstruction._generateHex(self.parsed)
-        self.s = s
-    
-    def _parseFromStr(s):
-        s = s.split(";")[0] #Ignore comments after ;
-        s = s.split("//")[0] #Ignore comments after //
-        s = s.strip()
-        parts = s.split(" ")
-        mnemonic = parts[0].upper()
-        args = " ".join(parts[1:])
-        parsed = []
-        if( mnemonic not in AllInstructionVariants ):
-            return;
-        variantInfo = AllInstructionVariants[mnemonic]
+class Engines:
+    INTERPRETER = "interpreter"  # The only ARM engine, the other names of riscv.computer.Engines run on it too
+
+class FlagOps:
+    # Kinds of Computer.flagState, the last flag-setting operation. N, Z, C and V are derived from it on demand
+    ADD =   "add"    # (ADD, a, b, a+b)          before masking to 32 bits
+    SUB =   "sub"    # (SUB, a, b, a-b)          CMP and SUBS
+    LOGIC = "logic"  # (LOGIC, carry, base, result) carry is None when the shifter left C alone, C and V come from base
+    NZCV =  "nzcv"   # (NZCV, N, Z, C, V)        already computed
+
+class Computer(BaseComputer):
+    # Same API as riscv.computer.Computer, both get loading, run/resume and DataMemory from BaseComputer
+    # RF[15] reads as the address of the instruction + 8. A zero word (andeq r0, r0, r0) halts like on RISC-V
+    registerNames = RegisterNames  # Writes to r15 are branches, ArmInstruction.run handles them with tracePC
+    
+    def __init__(self, engine=Engines.INTERPRETER, trace=TraceLevels.TEXT, dmemSize=2**16, imemSize=2**14):
+        BaseComputer.__init__(self, engine, trace, 16, dmemSize, imemSize)
+        self.flagState = (FlagOps.NZCV, 0, 0, 0, 0)
+    
+    def _savedExtra(self):
+        return self.flagState  # Immutable tuple
+    
+    def _restoreExtra(self, saved):
+        self.flagState = saved
+    
+    def _extraState(self):
+        return bytes(self.getFlags())
+    
+    def getFlags(self):
+        # (N, Z, C, V) as 0/1, computed from the last flag-setting operation only when something asks
+        state = self.flagState
+        kind = state[0]
+        if(kind == FlagOps.NZCV):
+            return state[1:]
+        if(kind == FlagOps.LOGIC):
+            carry, base, result = state[1:]
+            _, _, baseC, baseV = base[1:] if base[0] == FlagOps.NZCV else self._arithmeticFlags(base)
+            flags = (result>>31, int(result == 0), baseC if carry is None else carry, baseV)
+        else:
+            flags = self._arithmeticFlags(state)
+        self.flagState = (FlagOps.NZCV, *flags)
+        return flags
+    
+    def _arithmeticFlags(self, state):
+        kind, a, b, result = state
+        masked = result & 0xFFFFFFFF
+        if(kind == FlagOps.ADD):
+            return masked>>31, int(masked == 0), result>>32, (((a^result) & (b^result))>>31) & 1
+        return masked>>31, int(masked == 0), int(a >= b), (((a^b) & (a^result))>>31) & 1
+    
+    def conditionPassed(self, cond):
+        # cond is a ConditionCodes name, "" for always
+        if(not cond):
+            return True
+        state = self.flagState
+        if( cond in ["EQ","NE"] and state[0] != FlagOps.NZCV ):  # Z alone doesn't need the other flags
+            zero = (state[3] & 0xFFFFFFFF) == 0
+            return zero if cond == "EQ" else not zero
+        return ConditionCodes[cond][1](*self.getFlags())
+    
+    def setArithmeticFlags(self, kind, a, b, result):
+        self.flagState = (kind, a, b, result)
+    
+    def setLogicFlags(self, result, carry):
+        # N and Z from result, C from the shifter (None if it didn't shift), V is kept
+        state = self.flagState
+        if(state[0] == FlagOps.LOGIC):  # Its C and V come from its base, don't build a chain
+            if(carry is None):
+                carry = state[1]
+            state = state[2]
+        self.flagState = (FlagOps.LOGIC, carry, state, result)
+    
+
+
+class ArmInstruction(BaseInstruction):
+    def run(self, computer):
+        parsed = self.parsed
+        if( not computer.conditionPassed(parsed["cond"]) ):
+            computer.PC += 4
+            return
+        RF = computer.RF
+        RF[15] = (computer.PC+8) & 0xFFFFFFFF
+        mnem = parsed["mnem"]
+        op = InstructionDatabase[mnem]["op"]
+        next_PC = computer.PC+4
+        if(mnem == "BX"):
+            next_PC = RF[parsed["rm"]] & 0xFFFFFFFE  # No Thumb state, bit 0 is dropped
+        elif(op == 0b10):
+            if(mnem == "BL"):
+                computer.writeToRF(14, computer.PC+4)
+            next_PC = computer.PC + parsed["imm"]
+        elif(op == 0b00):
+            opr2, carry = ArmInstruction._shifterOperand(parsed, computer, self.h)
+            opr1 = RF[parsed["rn"]] if "rn" in parsed else 0
+            if(mnem == "ADD"):
+                result = opr1+opr2
+                if(parsed["S"]): computer.setArithmeticFlags(FlagOps.ADD, opr1, opr2, result)
+            elif(mnem in ["SUB","CMP"]):
+                result = opr1-opr2
+                if(parsed["S"]): computer.setArithmeticFlags(FlagOps.SUB, opr1, opr2, result)
+            else:
+                if(mnem == "AND"):   result = opr1&opr2
+                elif(mnem == "ORR"): result = opr1|opr2
+                elif(mnem == "MOV"): result = opr2
+                if(parsed["S"]): computer.setLogicFlags(result, carry)
+            if(mnem != "CMP"):
+                if(parsed["rd"] == 15):
+                    next_PC = result & 0xFFFFFFFC
+                else:
+                    computer.writeToRF(parsed["rd"], result)
+        else:
+            base = RF[parsed["rn"]]
+            offset = parsed["imm"] if "imm" in parsed else ArmInstruction._shifterOperand(parsed, computer, self.h)[0]
+            offsetAdr = (base+offset if parsed["U"] else base-offset) & 0xFFFFFFFF
+            adr = offsetAdr if parsed["P"] else base
+            numBytes = 1 if parsed["B"] else 4
+            if(mnem == "STR"):
+                computer.writeData(adr, RF[parsed["rd"]], numBytes)
+            if(parsed["W"] or not parsed["P"]):
+                computer.writeToRF(parsed["rn"], offsetAdr)
+            if(mnem == "LDR"):
+                result = computer.readData(adr, numBytes)
+                if(parsed["rd"] == 15):
+                    next_PC = result & 0xFFFFFFFC
+                else:
+                    computer.writeToRF(parsed["rd"], result)
+        if(next_PC != computer.PC+4 and computer.trace):
+            computer.tracePC(next_PC)
+        computer.PC = next_PC
+    
+    def _shifterOperand(parsed, computer, h):
+        # (value, carry) of Src2 or of a register offset in word h, carry is None when the shifter doesn't change C
+        if("imm" in parsed):  # A rotated immediate sets C to bit 31 whenever its rotate field isn't 0
+            value = parsed["imm"]
+            return value, (value>>31 if h & 0xF00 else None)
+        value = computer.RF[parsed["rm"]]
+        shift = parsed["shift"]
+        if("rs" in parsed):
+            amount = computer.RF[parsed["rs"]] & 0xFF
+            if(amount == 0):
+                return value, None
+            if(shift == "ROR"):
+                amount = (amount-1) % 32 + 1  # ROR by 32 leaves the value, but C is set to bit 31
+        else:
+            amount = parsed["shamt"]
+            if(amount == 0):
+                if(shift == "LSL"):
+                    return value, None
+                if(shift == "ROR"):  # RRX
+                    return (computer.getFlags()[2]<<31) | (value>>1), value & 1
+                amount = 32  # LSR #32 and ASR #32
+        if(shift == "LSL"):
+            return (value << amount) & 0xFFFFFFFF, ((value << amount) >> 32) & 1
+        if(shift == "LSR"):
+            return value >> amount, (value >> (amount-1)) & 1 if amount <= 32 else 0
+        if(shift == "ASR"):
+            value = signed(value)
+            return (value >> min(amount, 32)) & 0xFFFFFFFF, (value >> min(amount-1, 31)) & 1
+        return ((value >> amount) | (value << (32-amount))) & 0xFFFFFFFF, (value >> (amount-1)) & 1
+    
+    # Static functions
+    def _checkHex(h):
+        # (parsed, None) or (None, message), the mnemonic and the field parser come from one Decoders lookup
+        cond, opFunct = decodeKey(h)
+        cond = CondNames.get(cond)
+        decoder = Decoders.get(opFunct)
+        if(cond is None or decoder is None):
+            return None, f"Unknown instruction word 0x{h:08X}"
+        mnem, form, parse, parseRs = decoder
+        if(form == "BX"):
+            if( (h & 0x0FFFFFF0) != InstructionDatabase[mnem]["word"] ):
+                return None, f"Unknown instruction word 0x{h:08X}"
+            return parse(h, mnem, cond), None
+        if(form == "B"):
+            parsed = parse(h, mnem, cond)
+            parsed["imm"] += 8
+            return parsed, None
+        if(form == "rot"):
+            parsed = parse(h, mnem, cond)
+            parsed["imm"] = decodeRotatedImm(h)
+            return parsed, None
+        if(form == "imm"):
+            return parse(h, mnem, cond), None
+        if(h & 0x10):
+            if(parseRs is None or h & 0x80):   # Multiplies and the extra load/stores aren't supported
+                return None, f"Unknown instruction word 0x{h:08X}"
+            parse = parseRs
+        parsed = parse(h, mnem, cond)
+        parsed["shift"] = ShiftNames[parsed["shift"]]
+        return parsed, None
+    
+    def _checkStr(s, symbols=None, pc=0):
+        # (parsed, None, None), or (None, column, message) where column is the 0-based position of the problem in s
+        # Never raises, like RiscvInstruction._checkStr. Branch targets can be labels from symbols (a SymbolTable)
+        if(";" in s): s = s.split(";")[0] #Ignore comments after ;
+        if("@" in s): s = s.split("@")[0] #Ignore comments after @
+        if("//" in s): s = s.split("//")[0] #Ignore comments after //
+        mnemonic, _, args = s.strip().partition(" ")
+        column = len(s)-len(s.lstrip())
+        variantInfo = AllInstructionVariants.get(mnemonic.upper())
+        if(variantInfo is None):
+            if( len(mnemonic) == 0 ):
+                return None, column, "Missing instruction"
+            return None, column, f"Unknown instruction '{mnemonic}'"
         mainpart = variantInfo[0]
-        cond = variantInfo[1]
-        S = (len(variantInfo)>=3 and variantInfo[2]=="S")
-        instructionInfo = InstructionDatabase[mainpart]
-        op = instructionInfo["op"]
-        if(op == 0b00):  # To be continued ...
-            rd, rs1, rs2 = args.split(",")
-            parsed = {"mnem": mnemonic,  "rd": parseReg(rd), "rs1": parseReg(rs1), "rs2": parseReg(rs2)}
-        elif(op == 0b01 ):
-            parsed = {"mnem": mnemonic, "rd": parseReg(rd), "rs1": parseReg(rs1), "imm": imm}
-        elif(op == 0b10 ):
+        name = mnemonic.upper()
+        operands = ArmInstruction._splitOperands(args, column+len(mnemonic)+1)
+        if(operands is None):
+            return None, column+len(mnemonic)+1, "Unbalanced []"
+        parsed = {"mnem": mainpart, "cond": "" if variantInfo[1] == "AL" else variantInfo[1]}
+        op = InstructionDatabase[mainpart]["op"]
+        
+        if(mainpart == "BX"):
+            names = ["rm"]
+        elif(op == 0b10):
+            names = ["imm"]
+        elif(op == 0b01):
+            names = ["rd", "address"]
+            parsed["B"] = int(variantInfo[2] == "B")
+        else:
+            names = ["rd", "rn", "src2"]
+            if(mainpart == "MOV"): names = ["rd", "src2"]
+            if(mainpart == "CMP"): names = ["rn", "src2"]
+            parsed["S"] = int(variantInfo[2] == "S" or mainpart == "CMP")
+        
+        # The shift of a register Src2 and a post-index offset come after the last named operand
+        count = len(names)
+        extra = {"src2": 1, "address": 2}.get(names[-1], 0)
+        if( not (count <= len(operands) <= count+extra) ):
+            expected = f"{count}-{count+extra}" if extra else f"{count}"
+            return None, min(column+len(mnemonic)+1, len(s.rstrip())), f"{name} expects {expected} operands, got {len(operands)}"
+        for index,field in enumerate(names):
+            text, textColumn = operands[index]
+            if(field == "imm"):
+                value, message = ArmInstruction._checkBranchOffset(text, symbols, pc)
+                if(message is not None):
+                    return None, textColumn, message
+                parsed["imm"] = value
+            elif(field == "src2"):
+                fields, errorColumn, message = ArmInstruction._checkSrc2(operands[index:], True)
+                if(message is not None):
+                    return None, errorColumn, message
+                parsed.update(fields)
+            elif(field == "address"):
+                fields, errorColumn, message = ArmInstruction._checkAddress(operands[index:])
+                if(message is not None):
+                    return None, errorColumn, message
+                parsed.update(fields)
+            else:
+                value = checkReg(text)
+                if(value is None):
+                    return None, textColumn, "Missing register" if len(text.strip()) == 0 else f"Unknown register '{text.strip()}'"
+                parsed[field] = value
+        return parsed, None, None
+    
+    def _splitOperands(args, column):
+        # [(text, column)] of the comma separated operands, commas inside [] don't split. None if the [] don't match
+        operands = args.split(",")
+        if( "[" in args or "]" in args ):  # Join the pieces of "[Rn, offset]" again
+            joined = []
+            depth = 0
+            for text in operands:
+                if(depth > 0):
+                    joined[-1] += "," + text
+                else:
+                    joined.append(text)
+                depth += text.count("[") - text.count("]")
+                if( depth < 0 or depth > 1 ):
+                    return None
+            if(depth != 0):
+                return None
+            operands = joined
+        if( len(operands) == 1 and len(args.strip()) == 0 ):
+            return []
+        result = []
+        for text in operands:
+            result.append( (text, column+len(text)-len(text.lstrip())) )
+            column += len(text)+1
+        return result
+    
+    def _checkImm(text, column):
+        # Value of a "#imm" operand, (value, None, None) or (None, column, message)
+        body = text.strip()
+        if( not body.startswith("#") ):
+            return None, column, f"Expected #immediate, got '{body}'"
+        value = checkInt(body[1:])
+        if(value is None):
+            return None, column, "Missing immediate" if len(body) == 1 else f"Invalid immediate '{body}'"
+        return value, None, None
+    
+    def _checkShift(operands, allowRs):
+        # Fields of the "LSL #n", "LSL Rs" or "RRX" after a register operand, operands is [(text, column)] with 0 or 1 items
+        if( len(operands) == 0 ):
+            return {"shift": "LSL", "shamt": 0}, None, None
+        text, column = operands[0]
+        if( text.strip().upper() == "RRX" ):
+            return {"shift": "ROR", "shamt": 0}, None, None
+        shift, _, amount = text.strip().partition(" ")
+        shift = shift.upper()
+        if(shift not in ShiftTypes):
+            return None, column, f"Unknown shift '{text.strip()}'"
+        amountColumn = column+len(text.strip())-len(amount.lstrip())
+        if( not amount.strip().startswith("#") ):
+            rs = checkReg(amount)
+            if(rs is None or not allowRs):
+                return None, amountColumn, "Expected #amount" if not allowRs else f"Expected #amount or register, got '{amount.strip()}'"
+            return {"shift": shift, "rs": rs}, None, None
+        shamt, errorColumn, message = ArmInstruction._checkImm(amount, amountColumn)
+        if(message is not None):
+            return None, errorColumn, message
+        low, high = (1, 32) if shift in ["LSR","ASR"] else (1, 31) if shift == "ROR" else (0, 31)
+        if( not (low <= shamt <= high) ):
+            return None, amountColumn, f"{shift} amount must be {low}-{high}"
+        return {"shift": shift, "shamt": shamt % 32}, None, None  # LSR #32 and ASR #32 are encoded as 0
+    
+    def _checkSrc2(operands, allowRs):
+        # Fields of "#imm", "Rm" or "Rm, shift" for data-processing instructions
+        text, column = operands[0]
+        if( text.strip().startswith("#") ):
+            value, errorColumn, message = ArmInstruction._checkImm(text, column)
+            if(message is not None):
+                return None, errorColumn, message
+            if( len(operands) > 1 ):
+                return None, operands[1][1], "An immediate can't be shifted"
+            if( not (-(1<<31) <= value < (1<<32)) or encodeRotatedImm(value) is None ):
+                return None, column, f"{text.strip()} isn't an 8-bit value rotated by an even amount"
+            return {"imm": value & 0xFFFFFFFF}, None, None
+        rm = checkReg(text)
+        if(rm is None):
+            return None, column, "Missing register" if len(text.strip()) == 0 else f"Unknown register '{text.strip()}'"
+        fields, errorColumn, message = ArmInstruction._checkShift(operands[1:], allowRs)
+        if(message is not None):
+            return None, errorColumn, message
+        fields["rm"] = rm
+        return fields, None, None
+    
+    def _checkOffset(operands):
+        # Fields of a memory offset "#+-imm12" or "+-Rm{, shift #n}", operands is [(text, column)]
+        text, column = operands[0]
+        body = text.strip()
+        if( body.startswith("#") ):
+            value, errorColumn, message = ArmInstruction._checkImm(text, column)
+            if(message is not None):
+                return None, errorColumn, message
+            if( len(operands) > 1 ):
+                return None, operands[1][1], "An immediate offset can't be shifted"
+            if( not (-4096 < value < 4096) ):
+                return None, column, "Offset doesn't fit to 12 bits"
+            return {"U": int(value >= 0 and not body[1:].lstrip().startswith("-")), "imm": abs(value)}, None, None
+        U = 1
+        if( body[:1] in ["+","-"] ):
+            U = int(body[0] == "+")
+            body = body[1:]
+        rm = checkReg(body)
+        if(rm is None):
+            return None, column, "Missing register" if len(body.strip()) == 0 else f"Unknown register '{body.strip()}'"
+        fields, errorColumn, message = ArmInstruction._checkShift(operands[1:], False)
+        if(message is not None):
+            return None, errorColumn, message
+        fields.update({"U": U, "rm": rm})
+        return fields, None, None
+    
+    def _checkAddress(operands):
+        # Fields of "[Rn]", "[Rn, offset]", "[Rn, offset]!" and "[Rn], offset", operands starts from the address
+        text, column = operands[0]
+        body = text.strip()
+        writeBack = body.endswith("!")
+        if(writeBack):
+            body = body[:-1].rstrip()
+        if( not (body.startswith("[") and body.endswith("]")) ):
+            return None, column, "Expected [register] or [register, offset]"
+        inner = ArmInstruction._splitOperands(body[1:-1], column+1) or [("", column+1)]
+        rn = checkReg(inner[0][0])
+        if(rn is None):
+            return None, inner[0][1], "Missing register" if len(inner[0][0].strip()) == 0 else f"Unknown register '{inner[0][0].strip()}'"
+        offset = inner[1:]
+        fields = {"rn": rn, "P": 1, "W": int(writeBack)}
+        if( len(operands) > 1 ):   # Post-indexed, the address register is always updated
+            if( len(inner) > 1 or writeBack ):
+                return None, operands[1][1], "Offset given twice"
+            offset = operands[1:]
+            fields["P"] = 0
+        if( len(offset) == 0 ):
+            fields.update({"U": 1, "imm": 0})
+            return fields, None, None
+        if( len(offset) > 2 ):
+            return None, offset[2][1], "Too many address operands"
+        offsetFields, errorColumn, message = ArmInstruction._checkOffset(offset)
+        if(message is not None):
+            return None, errorColumn, message
+        fields.update(offsetFields)
+        return fields, None, None
+    
+    def _checkBranchOffset(text, symbols, pc):
+        # Byte offset from the branch instruction, the encoding is relative to PC+8. A label is made relative to pc
+        value = checkInt(text[text.index("#")+1:] if "#" in text else text)
+        if(value is None):
+            if( len(text.strip()) == 0 ):
+                return None, "Missing offset"
+            if( SymbolPattern.fullmatch(text) is None ):
+                return None, f"Invalid offset '{text.strip()}'"
+            if(symbols is None):
+                symbols = SymbolTable()
+            target, message = symbols.evaluate(text)
+            if(message is not None):
+                return None, message
+            value = target-pc
+        if(value % 4 != 0):
+            return None, "Offset must be a multiple of 4"
+        if( not (-(1<<25) <= value-8 < (1<<25)) ):
+            return None, "Offset doesn't fit to 26 bits"
+        return value, None
+    
+    def _generateHex(parsed):
+        form, fixed, immEncoder, shamtEncoder, rsEncoder = EncodeForms[parsed["mnem"]]
+        binary = CondBits[parsed["cond"]]
+        if(form == "rot"):
+            if("imm" in parsed):
+                return binary | immEncoder(parsed) | RotatedImmediates[parsed["imm"] & 0xFFFFFFFF]
+        elif(form == "imm"):
+            if("imm" in parsed):
+                return binary | immEncoder(parsed)
+        elif(form == "B"):
+            return binary | fixed | ((parsed["imm"]-8)>>2) & 0xFFFFFF
+        else:   # BX
+            return binary | fixed | parsed["rm"]
+        if("rs" in parsed):
+            return binary | rsEncoder(parsed) | ShiftTypes[parsed["shift"]]<<5
+        return binary | shamtEncoder(parsed) | ShiftTypes[parsed["shift"]]<<5
+    
+    def _generateStr(parsed):
+        mnem = parsed["mnem"]
+        op = InstructionDatabase[mnem]["op"]
+        suffix = ("s" if parsed.get("S") and mnem != "CMP" else "") + ("b" if parsed.get("B") else "")
+        name = mnem.lower() + suffix + parsed["cond"].lower()
+        instruction_str = name + (" "*(8-len(name)))
+        if(mnem == "BX"):
+            return instruction_str + RegisterNames[parsed["rm"]]
+        if(op == 0b10):
+            return instruction_str + num2str(parsed["imm"])
+        
+        if("imm" in parsed):
+            operand = "#" + num2str(parsed["imm"])
+        else:
+            operand = RegisterNames[parsed["rm"]]
+            shift = parsed["shift"].lower()
+            if("rs" in parsed):
+                operand += f", {shift} {RegisterNames[parsed['rs']]}"
+            elif(parsed["shift"] == "ROR" and parsed["shamt"] == 0):
+                operand += ", rrx"
+            elif(parsed["shamt"] != 0 or parsed["shift"] != "LSL"):
+                operand += f", {shift} #{parsed['shamt'] or 32}"
+        if(op == 0b00):
+            registers = [RegisterNames[parsed[field]] for field in ["rd", "rn"] if field in parsed]
+            return instruction_str + ", ".join(registers + [operand])
+        
+        if(not parsed["U"]):
+            operand = "#-" + operand[1:] if "imm" in parsed else "-" + operand
+        rd, rn = RegisterNames[parsed["rd"]], RegisterNames[parsed["rn"]]
+        if(not parsed["P"]):
+            return instruction_str + f"{rd}, [{rn}], {operand}"
+        if( "imm" in parsed and parsed["imm"] == 0 and parsed["U"] and not parsed["W"] ):
+            return instruction_str + f"{rd}, [{rn}]"
+        return instruction_str + f"{rd}, [{rn}, {operand}]" + ("!" if parsed["W"] else "")
 
-        return parsed
-            
 
+check_word = ArmInstruction.checkWord  # (text, None) or (None, message) if the word isn't a known instruction
+
+ArmIsa = Isa("arm", ArmInstruction.checkInstruction, check_word, [";", "@", "//"])
+Computer.isa = ArmIsa
+Computer.instructionClass = ArmInstruction
 
 def assemble(assembly_str):
-    lines = assembly_str.split("\n")
-    response_str=""
-    r = ArmInstruction()
-    for line in lines:
-        line=line.split(":")[-1]
-        line=line.strip()
-        if( len(line) == 0 ):
-            response_str += "\n"
-            continue
-        try:
-            r.fromStr(line)
-            hex_str = f"{r.h:08X}"
-            hex_str = hex_str[6:8]+" "+hex_str[4:6]+" "+hex_str[2:4]+" "+hex_str[0:2] # Reverse byte order
-            response_str += f"{hex_str}\n"
-        except Exception as e:
-            response_str += f"ERROR\n"
-            print(f"Exception occured: {e}")
-    return response_str[:-1]
+    return "\n".join(assemble_lines(assembly_str.split("\n")))
+
+# See isa.assembler.Isa for what each of these does
+assemble_lines = ArmIsa.assembleLines
+assemble_line = ArmIsa.assembleLine
+check_line = ArmIsa.checkLine
+encode_line = ArmIsa.encodeLine
+assemble_checked = ArmIsa.assembleChecked
+assemble_program = ArmIsa.assembleProgram
+assemble_bytes = ArmIsa.assembleBytes
 
 def disassemble(hex_str):
-    lines = hex_str.split("\n")
-    response_str=""
-    r = ArmInstruction()
-    address=0
-    for line in lines:
-        line=line.strip()
-        line=line.replace("_","").replace(" ","")
-        if( len(line) == 0 ):
-            response_str += "\n"
-            continue
-        response_str += f"_{address:02X}: "
-        address += 4
-        if( len(line) != 8 ):
-            response_str += "ERROR\n"
-            continue
-        try:
-            line = line[6:8]+line[4:6]+line[2:4]+line[0:2] # Reverse byte order
-            inst_hex = int(line,16)
-            r.fromHex(inst_hex)
-            response_str += f"{r.s}\n"
-        except Exception as e:
-            response_str += f"ERROR\n"
-            print(f"Exception occured: {e}")
-    return response_str[:-1]
+    return "\n".join(disassemble_lines(hex_str.split("\n")))
+
+disassemble_lines = ArmIsa.disassembleLines
+disassemble_hex_line = ArmIsa.disassembleHexLine
+check_hex_line = checkHexLine
+parse_hex_line = parseHexLine
+disassemble_word = ArmIsa.disassembleWord
+decode_word = ArmIsa.decodeWord
+disassemble_checked = ArmIsa.disassembleChecked
+disassemble_bytes_lines = ArmIsa.disassembleBytesLines
 
 if __name__ == "__main__":
     with open("session_instr.s","r") as f:
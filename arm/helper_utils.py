@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+from isa.helper_utils import *
 
 RegisterMap = {
     "r0" : 0,
@@ -22,6 +23,7 @@ RegisterMap = {
     "lr" : 14,
     "pc" : 15,
 }
+RegisterNames = [f"r{i}" for i in range(13)] + ["sp", "lr", "pc"]
 
 InstructionDatabase = {
     "ADD": {"op":0b00, "cmd": 0b0100},
@@ -31,14 +33,17 @@ InstructionDatabase = {
     "MOV": {"op":0b00, "cmd": 0b1101},
     "CMP": {"op":0b00, "cmd": 0b1010},
 
-    "STR": {"op":0b01},
-    "LDR": {"op":0b01},
+    "STR": {"op":0b01, "L": 0},
+    "LDR": {"op":0b01, "L": 1},
 
-    "B":  {"op":0b10},
-    "BL": {"op":0b10},
-    "BX": {"op":0b10}
+    "B":  {"op":0b10, "L": 0},
+    "BL": {"op":0b10, "L": 1},
+    "BX": {"op":0b10, "word": 0x012FFF10}  # Encoded in the data-processing space, cond | word | Rm
 }
 
+ShiftTypes = {"LSL": 0b00, "LSR": 0b01, "ASR": 0b10, "ROR": 0b11}
+ShiftNames = {value: name for name,value in ShiftTypes.items()}
+
 ConditionCodes = {
     "EQ": [0b0000, lambda N,Z,C,V: (Z) ],
     "NE": [0b0001, lambda N,Z,C,V: (not Z) ],
@@ -51,7 +56,7 @@ ConditionCodes = {
     "VC": [0b0111, lambda N,Z,C,V: (not V) ],
 
     "HI": [0b1000, lambda N,Z,C,V: (C and (not Z)) ],
-    "LS": [0b1001, lambda N,Z,C,V: ((not C) and Z) ],
+    "LS": [0b1001, lambda N,Z,C,V: ((not C) or Z) ],
     "GE": [0b1010, lambda N,Z,C,V: (N == V) ],
     "LT": [0b1011, lambda N,Z,C,V: (N != V) ],
 
@@ -60,47 +65,166 @@ ConditionCodes = {
     "AL": [0b1110, lambda N,Z,C,V: (True) ]
 }
 ConditionCodes[""] = ConditionCodes["AL"]
+CondNames = {value[0]: name for name,value in ConditionCodes.items() if name != "AL"}  # AL is left out of the text
 
 # Generate all possible instruction combinations
+# Both the old "ADDEQS" and the unified "ADDSEQ" order of the suffixes are accepted, B is the byte variant of LDR/STR
 def generateAllVariants():
     variants0  = {a + b + c: [a, b, c] for a in InstructionDatabase if InstructionDatabase[a]["op"]==0b00 for b in ConditionCodes for c in ["","S"]}  #DP Instruction variants
-    variants1  = {a + b + c: [a, b, c] for a in InstructionDatabase if InstructionDatabase[a]["op"]==0b01 for b in ConditionCodes for c in ["","S"]}  #Memory Instruction variants
+    variants1  = {a + b + c: [a, b, c] for a in InstructionDatabase if InstructionDatabase[a]["op"]==0b01 for b in ConditionCodes for c in ["","B"]}  #Memory Instruction variants
     variants2  = {a + b    : [a, b   ] for a in InstructionDatabase if InstructionDatabase[a]["op"]==0b10 for b in ConditionCodes}  #Branch Instruction variants
-    return {**variants0, **variants1, **variants2}
+    unified    = {a + c + b: [a, b, c] for a,b,c in [*variants0.values(), *variants1.values()] if c}
+    return {**unified, **variants0, **variants1, **variants2}
 
 AllInstructionVariants = generateAllVariants()
 
-
-def parseReg(regString):
-    return RegisterMap[regString.lower().strip()]
-
-
-def num2str(num):
-    if(num<1000 and num>-1000):
-        return str(num)
-    else:
-        if(num<0):
-            return f"-0x{-num:X}"
+parseReg, checkReg = makeRegisterParsers(RegisterMap)
+
+# Value -> 12-bit rot:imm8 field of every data-processing immediate (imm8 rotated right by 2*rot), the smallest rot wins
+RotatedImmediates = {}
+for rot in range(16):
+    for imm8 in range(256):
+        RotatedImmediates.setdefault(((imm8 >> 2*rot) | (imm8 << (32-2*rot))) & 0xFFFFFFFF, rot<<8 | imm8)
+
+def encodeRotatedImm(value):
+    # None if value has no encoding
+    return RotatedImmediates.get(value & 0xFFFFFFFF)
+
+def decodeRotatedImm(src2):
+    rot = getBits(src2,11,8)*2
+    imm8 = getBits(src2,7,0)
+    return ((imm8 >> rot) | (imm8 << (32-rot))) & 0xFFFFFFFF
+
+"""
+Instruction word fields
+    [31:28] cond   [27:26] op   [25:20] funct   [19:16] Rn   [15:12] Rd   [11:0] Src2
+    op=00 (data-processing): funct = I cmd S,     Src2 = rot imm8 | shamt sh 0 Rm | Rs 0 sh 1 Rm
+    op=01 (memory):          funct = ~I P U B W L, Src2 = imm12 | shamt sh 0 Rm
+    op=10 (branch):          funct = 1 L imm24[23:20]
+"""
+
+# (op, funct) -> [mnemonic], a word is decoded with one lookup
+def generateDecodeTable():
+    table = {}
+    for mnem,value in InstructionDatabase.items():
+        op = value["op"]
+        for funct in range(64):
+            if("word" in value):      # BX, the rest of the word is checked when decoding
+                if( funct != getBits(value["word"],25,20) ):
+                    continue
+                table.setdefault( (getBits(value["word"],27,26), funct), [] ).append(mnem)
+                continue
+            if(op == 0b00):
+                if( getBits(funct,4,1) != value["cmd"] ):
+                    continue
+                if( mnem == "CMP" and getBits(funct,0,0) == 0 ):  # Comparisons always set the flags
+                    continue
+            elif(op == 0b01):
+                if( getBits(funct,0,0) != value["L"] ):
+                    continue
+                if( getBits(funct,4,4) == 0 and getBits(funct,1,1) == 1 ):  # Post-indexed with W is LDRT/STRT
+                    continue
+            elif(op == 0b10):
+                if( getBits(funct,5,4) != (0b10 | value["L"]) ):
+                    continue
+            table.setdefault( (op, funct), [] ).append(mnem)
+    return table
+
+DecodeTable = generateDecodeTable()
+
+# Word bits of each operand field, the layouts below are built from these. See isa.helper_utils.makeFieldParser
+FieldBits = {"S": (20,20), "B": (22,22), "P": (24,24), "U": (23,23), "W": (21,21), "rn": (19,16), "rd": (15,12),
+             "imm": (11,0), "rm": (3,0), "shift": (6,5), "shamt": (11,7), "rs": (11,8)}
+BranchLayout = [("imm", [(23,0,2)], 26)]  # imm24*4, the offset from PC+8
+
+def fieldLayout(*names):
+    return [(name, [FieldBits[name] + (0,)], 0) for name in names]
+
+def operandFields(mnem):
+    # Fields before Src2 (data-processing) or the offset (memory), in the order of the parsed dict
+    if(InstructionDatabase[mnem]["op"] == 0b01):
+        return ("B", "rd", "rn", "P", "U", "W")
+    return ("S",) + (() if mnem == "CMP" else ("rd",)) + (() if mnem == "MOV" else ("rn",))
+
+"""
+Src2 forms
+    "rot":   data-processing rotated immediate, the imm field isn't a plain bit field
+    "imm":   memory imm12
+    "shamt": register shifted by an immediate (sh is decoded to a ShiftNames name separately)
+    "rs":    register shifted by a register, data-processing only
+"""
+FormFields = {"rot": (), "imm": ("imm",), "shamt": ("rm", "shift", "shamt"), "rs": ("rm", "shift", "rs")}
+
+_fieldParsers = {}
+def _fieldParser(names):
+    if(names not in _fieldParsers):
+        _fieldParsers[names] = makeFieldParser(fieldLayout(*names) if names else BranchLayout, ("mnem", "cond"))
+    return _fieldParsers[names]
+
+# op<<6 | funct (word bits [27:20]) -> (mnemonic, form, parser, parser of the "rs" form or None)
+# Parsers are fn(word, mnemonic, condition) -> parsed dict. Single-match DecodeTable entries only
+def generateDecoders():
+    decoders = {}
+    for (op,funct),matches in DecodeTable.items():
+        if(len(matches) != 1):
+            continue
+        mnem = matches[0]
+        if("word" in InstructionDatabase[mnem]):
+            decoders[op<<6 | funct] = (mnem, "BX", _fieldParser(("rm",)), None)
+        elif(op == 0b10):
+            decoders[op<<6 | funct] = (mnem, "B", _fieldParser(()), None)
         else:
-            return f"0x{num:X}"
-    
-def signed(value, bitlen=32):
-    if( (value>>(bitlen-1)) > 0 ):
-        value -= 1<<(bitlen)
-    return value
-
-def unsigned(value, bitlen=32):
-    return value % (1<<bitlen)
-
-def getBits(num, high, low):
-    num = num & ( ( 1<<(high+1) )-1 )
-    return num>>low
-
-def num2Hex(num):
-    hex_str=f"{num:08x}"
-    #hex_str = hex_str[::-1]
-    hex_str = hex_str[0:4] + "_" + hex_str[4:8]
-    return "0x"+hex_str
-
-
+            fields = operandFields(mnem)
+            immediate = getBits(funct,5,5) != op  # I is inverted for memory instructions
+            if(immediate):
+                form = "rot" if op == 0b00 else "imm"
+                decoders[op<<6 | funct] = (mnem, form, _fieldParser(fields + FormFields[form]), None)
+            else:
+                rsParser = _fieldParser(fields + FormFields["rs"]) if op == 0b00 else None
+                decoders[op<<6 | funct] = (mnem, "shamt", _fieldParser(fields + FormFields["shamt"]), rsParser)
+    return decoders
+
+Decoders = generateDecoders()
+
+# word -> (cond, op<<6 | funct)
+decodeKey = makeFieldExtractor([("cond", [(31,28,0)], 0), ("opFunct", [(27,20,0)], 0)])
+
+# (mnemonic, form) -> fn(parsed) -> word without the condition, data-processing and memory instructions
+# The shift type and the rotated immediate aren't plain fields and are added by the caller
+def generateEncoders():
+    encoders = {}
+    for mnem,info in InstructionDatabase.items():
+        op = info["op"]
+        if( "word" in info or op == 0b10 ):
+            continue
+        fields = operandFields(mnem)
+        if(op == 0b00):
+            fixed = info["cmd"]<<21
+            forms = {"rot": fixed | 1<<25, "shamt": fixed, "rs": fixed | 1<<4}
+        else:
+            fixed = 1<<26 | info["L"]<<20
+            forms = {"imm": fixed, "shamt": fixed | 1<<25}
+        for form,bits in forms.items():
+            names = fields + tuple(name for name in FormFields[form] if name != "shift")
+            encoders[(mnem, form)] = makeFieldEncoder(fieldLayout(*names), bits)
+    return encoders
+
+Encoders = generateEncoders()
+
+# mnemonic -> (form of an immediate Src2, fixed word bits, its encoder, "shamt" encoder, "rs" encoder), one lookup
+# per encoded instruction. BX and branches have no encoders, their fixed bits hold op, L and the BX word
+def generateEncodeForms():
+    forms = {}
+    for mnem,info in InstructionDatabase.items():
+        if("word" in info):
+            forms[mnem] = ("BX", info["word"], None, None, None)
+        elif(info["op"] == 0b10):
+            forms[mnem] = ("B", 0b101<<25 | info["L"]<<24, None, None, None)
+        elif(info["op"] == 0b00):
+            forms[mnem] = ("rot", 0, Encoders[(mnem, "rot")], Encoders[(mnem, "shamt")], Encoders[(mnem, "rs")])
+        else:
+            forms[mnem] = ("imm", 0, Encoders[(mnem, "imm")], Encoders[(mnem, "shamt")], None)
+    return forms
 
+EncodeForms = generateEncodeForms()
+CondBits = {name: value[0]<<28 for name,value in ConditionCodes.items()}  # Word bits [31:28]
@@ -0,0 +1 @@
+from . import programs
\ No newline at end of file
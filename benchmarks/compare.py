@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# python3 -m benchmarks.compare old.json new.json [--threshold 0.1]
+# Rate change of every benchmark between two benchmarks.run results. Exits with 1 if a benchmark got slower
+# than the threshold allows, so a script can stop on a regression
+
+import argparse
+import json
+import sys
+
+def spread(result):
+    # Slowest repeat relative to the fastest, how much the machine wandered during the run
+    samples = result.get("samples") or [result["seconds"]]
+    return max(samples)/min(samples) - 1
+
+def compare(old, new, threshold):
+    # (report lines, names of the regressed benchmarks). A change smaller than the spread of the runs is likely noise
+    lines = [f"{'benchmark':40} {'old':>14} {'new':>14} {'change':>8} {'spread':>8}"]
+    regressions = []
+    for name in sorted(set(old) | set(new)):
+        if(name not in new):
+            lines.append(f"{name:40} {old[name]['rate']:14,.0f} {'-':>14}   only in old")
+            continue
+        if(name not in old):
+            lines.append(f"{name:40} {'-':>14} {new[name]['rate']:14,.0f}   only in new")
+            continue
+        change = new[name]["rate"]/old[name]["rate"] - 1
+        mark = ""
+        if(change < -threshold):
+            mark = "  REGRESSION"
+            regressions.append(name)
+        noise = max(spread(old[name]), spread(new[name]))
+        lines.append(f"{name:40} {old[name]['rate']:14,.0f} {new[name]['rate']:14,.0f} {change:+8.1%} {noise:8.1%}{mark}")
+    return lines, regressions
+
+def _describe(report):
+    commit = (report.get("commit") or "unknown")[:10] + (" (dirty)" if report.get("dirty") else "")
+    return f"{commit}, Python {report.get('python')}, {report.get('date')}" + (", quick" if report.get("quick") else "")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares two benchmarks.run results")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="largest accepted slowdown, 0.1 is 10%%")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if( old.get("quick") != new.get("quick") ):
+        print("Warning: comparing a --quick run with a full run, the inputs differ", file=sys.stderr)
+    print(f"old: {_describe(old)}")
+    print(f"new: {_describe(new)}")
+    lines, regressions = compare(old["results"], new["results"], args.threshold)
+    print("\n".join(lines))
+    if(regressions):
+        print(f"{len(regressions)} benchmarks are more than {args.threshold:.0%} slower", file=sys.stderr)
+        sys.exit(1)
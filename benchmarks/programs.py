@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+import random
+
+import riscv
+import arm
+from riscv.computer import RiscvInstruction
+from arm.computer import ArmInstruction
+
+"""
+Synthetic programs for the benchmarks. Every generator is deterministic for a given seed, so two commits are
+measured on the same input
+    random_*_words(count, seed):    valid instruction words, mnemonics drawn evenly from InstructionDatabase
+    *_listing(lines, seed):         assembly text of random instructions with a label and a branch to it now and then
+    *_kernel(name, ...):            loop-heavy programs for Computer.run, see Kernels
+"""
+
+# Immediate ranges per RISC-V instruction type: (lowest, highest, step)
+RiscvImmRanges = {"I": (-2048, 2047, 1), "I2": (0, 31, 1), "S": (-2048, 2047, 1), "B": (-4096, 4094, 2),
+                  "U": (0, (1<<32)-(1<<12), 1<<12), "J": (-(1<<20), (1<<20)-2, 2)}
+RiscvFields = {"R": ("rd", "rs1", "rs2"), "I": ("rd", "rs1"), "I2": ("rd", "rs1"), "S": ("rs1", "rs2"),
+               "B": ("rs1", "rs2"), "U": ("rd",), "J": ("rd",)}
+
+def random_riscv_words(count, seed=0):
+    rng = random.Random(seed)
+    mnemonics = [mnem for mnem in riscv.helper_utils.InstructionDatabase if mnem != "HALT"]  # Only the zero word halts
+    words = []
+    for _ in range(count):
+        mnem = rng.choice(mnemonics)
+        type = riscv.helper_utils.InstructionDatabase[mnem][0]
+        parsed = {"mnem": mnem}
+        for name in RiscvFields[type]:
+            parsed[name] = rng.randrange(32)
+        if(type in RiscvImmRanges):
+            low, high, step = RiscvImmRanges[type]
+            parsed["imm"] = rng.randrange(low, high+1, step)
+        words.append(RiscvInstruction._generateHex(parsed))
+    return words
+
+def random_arm_words(count, seed=0):
+    # A mnemonic, then one of its decode keys (word bits [27:20]) and random other bits until the word decodes
+    rng = random.Random(seed)
+    keys = {}
+    for key,decoder in arm.helper_utils.Decoders.items():
+        keys.setdefault(decoder[0], []).append(key)
+    mnemonics = sorted(keys)
+    conditions = sorted(arm.helper_utils.CondNames) + [0b1110]
+    words = []
+    while(len(words) < count):
+        mnem = rng.choice(mnemonics)
+        word = rng.choice(conditions)<<28 | rng.choice(keys[mnem])<<20 | rng.getrandbits(20)
+        if(mnem == "BX"):
+            word = (word & 0xF000000F) | arm.helper_utils.InstructionDatabase["BX"]["word"]
+        if( ArmInstruction._checkHex(word)[1] is None ):
+            words.append(word)
+    return words
+
+def _listing(words, checkWord, branch, lines, seed):
+    rng = random.Random(seed)
+    source = []
+    label = 0
+    for word in words:
+        if( len(source) >= lines ):
+            break
+        if( len(source) % 64 == 0 ):
+            source.append(f"L{label}:")
+            label += 1
+        elif( rng.random() < 0.02 ):
+            source.append(branch.format(label=f"L{rng.randrange(max(0, label-2), label)}"))  # Within reach of a B-type offset
+        else:
+            source.append(checkWord(word)[0])
+    return "\n".join(source)
+
+def riscv_listing(lines, seed=0):
+    return _listing(random_riscv_words(lines, seed), riscv.computer.riscv_check_word, "beq     x5, x6, {label}", lines, seed)
+
+def arm_listing(lines, seed=0):
+    return _listing(random_arm_words(lines, seed), arm.computer.check_word, "bne     {label}", lines, seed)
+
+def words_to_hex(words):
+    # Hex text as /<arch>/disassemble_api takes it
+    return "\n".join(f"{word&0xFF:02X} {(word>>8)&0xFF:02X} {(word>>16)&0xFF:02X} {word>>24:02X}" for word in words)
+
+
+# Kernels fill DataMemory from address 0 with a x*5+1 sequence, then loop. size is in words, repeats counts the
+# outer loop. Programs end by running into the zero words after them
+RiscvKernels = {
+    "fibonacci": """
+    li   s0, {repeats}
+outer:
+    li   t0, 0
+    li   t1, 1
+    li   t2, {size}
+fib:
+    add  t3, t0, t1
+    mv   t0, t1
+    mv   t1, t3
+    addi t2, t2, -1
+    bne  t2, x0, fib
+    sw   t0, 0(x0)
+    addi s0, s0, -1
+    bne  s0, x0, outer
+""",
+    "memcpy": """
+    li   t0, 12345
+    li   t1, 0
+    li   t2, {size}
+fill:
+    slli t3, t0, 2
+    add  t0, t0, t3
+    addi t0, t0, 1
+    sw   t0, 0(t1)
+    addi t1, t1, 4
+    addi t2, t2, -1
+    bne  t2, x0, fill
+    li   s0, {repeats}
+copy:
+    li   t1, 0
+    li   t4, {bytes}
+    li   t2, {size}
+loop:
+    lw   t3, 0(t1)
+    sw   t3, 0(t4)
+    addi t1, t1, 4
+    addi t4, t4, 4
+    addi t2, t2, -1
+    bne  t2, x0, loop
+    addi s0, s0, -1
+    bne  s0, x0, copy
+""",
+    "bubble_sort": """
+    li   t0, 12345
+    li   t1, 0
+    li   t2, {size}
+fill:
+    slli t3, t0, 2
+    add  t0, t0, t3
+    addi t0, t0, 1
+    sw   t0, 0(t1)
+    addi t1, t1, 4
+    addi t2, t2, -1
+    bne  t2, x0, fill
+    li   s1, {passes}
+outer:
+    li   t1, 0
+    mv   t2, s1
+inner:
+    lw   t3, 0(t1)
+    lw   t4, 4(t1)
+    bgeu t4, t3, ordered
+    sw   t4, 0(t1)
+    sw   t3, 4(t1)
+ordered:
+    addi t1, t1, 4
+    addi t2, t2, -1
+    bne  t2, x0, inner
+    addi s1, s1, -1
+    bne  s1, x0, outer
+""",
+}
+
+# The same kernels for ARM, {load rN value} is a MOV/ORR sequence as wide constants have no immediate encoding
+ArmKernels = {
+    "fibonacci": """
+    MOV  r5, #0
+    {load r4 repeats}
+outer:
+    MOV  r0, #0
+    MOV  r1, #1
+    {load r2 size}
+fib:
+    ADD  r3, r0, r1
+    MOV  r0, r1
+    MOV  r1, r3
+    SUBS r2, r2, #1
+    BNE  fib
+    STR  r0, [r5]
+    SUBS r4, r4, #1
+    BNE  outer
+""",
+    "memcpy": """
+    {load r0 12345}
+    MOV  r1, #0
+    {load r2 size}
+fill:
+    ADD  r0, r0, r0, LSL #2
+    ADD  r0, r0, #1
+    STR  r0, [r1], #4
+    SUBS r2, r2, #1
+    BNE  fill
+    {load r4 repeats}
+copy:
+    MOV  r1, #0
+    {load r5 bytes}
+    {load r2 size}
+loop:
+    LDR  r3, [r1], #4
+    STR  r3, [r5], #4
+    SUBS r2, r2, #1
+    BNE  loop
+    SUBS r4, r4, #1
+    BNE  copy
+""",
+    "bubble_sort": """
+    {load r0 12345}
+    MOV  r1, #0
+    {load r2 size}
+fill:
+    ADD  r0, r0, r0, LSL #2
+    ADD  r0, r0, #1
+    STR  r0, [r1], #4
+    SUBS r2, r2, #1
+    BNE  fill
+    {load r4 passes}
+outer:
+    MOV  r1, #0
+    MOV  r2, r4
+inner:
+    LDR  r3, [r1]
+    LDR  r6, [r1, #4]
+    CMP  r6, r3
+    STRCC r6, [r1]
+    STRCC r3, [r1, #4]
+    ADD  r1, r1, #4
+    SUBS r2, r2, #1
+    BNE  inner
+    SUBS r4, r4, #1
+    BNE  outer
+""",
+}
+
+def _kernelValues(size, repeats):
+    return {"size": size, "repeats": repeats, "bytes": 4*size, "passes": size-1}
+
+def riscv_kernel(name, size, repeats=1):
+    return RiscvKernels[name].format(**_kernelValues(size, repeats))
+
+def _armLoad(reg, value):
+    # MOV of the lowest non-zero byte, ORR of the others. Each byte at an even position is a rotated immediate
+    chunks = [value & (0xFF << shift) for shift in range(0, 32, 8) if value & (0xFF << shift)] or [0]
+    return "\n    ".join([f"MOV  {reg}, #{chunks[0]}"] + [f"ORR  {reg}, {reg}, #{chunk}" for chunk in chunks[1:]])
+
+def arm_kernel(name, size, repeats=1):
+    values = _kernelValues(size, repeats)
+    lines = []
+    for line in ArmKernels[name].split("\n"):
+        if( line.strip().startswith("{load ") ):
+            reg, value = line.strip()[6:-1].split(" ")
+            line = "    " + _armLoad(reg, values[value] if value in values else int(value))
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# python3 -m benchmarks.run [--quick] [--output results.json] [--filter text]
+# Progress goes to stderr, the results JSON to --output or stdout. Compare two runs with benchmarks.compare
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import riscv
+import arm
+from isa.computer import TraceLevels, StopReasons
+from benchmarks.programs import *
+
+"""
+Results (JSON):
+    "commit":   git HEAD of the measured tree, "dirty" is True when it had uncommitted changes
+    "python", "platform", "date", "quick"
+    "results":  {name: {"unit": "lines/s" | "instructions/s" | "requests/s", "rate": work per second in the fastest
+                repeat, "work": units done per repeat, "seconds": time of the fastest repeat, "samples": seconds of every repeat}}
+Names are <group>.<arch>.<what>[.<variant>], e.g. "assemble.riscv.listing" or "run.riscv.memcpy.block"
+"""
+
+# Program sizes, the full set runs in well under a minute
+Sizes = {
+    "full":  {"words": 20000, "listing": 20000, "repeats": 5, "requests": 400,
+              "kernels": {"fibonacci": (1000, 50), "memcpy": (2048, 10), "bubble_sort": (150, 1)}},
+    "quick": {"words": 2000, "listing": 2000, "repeats": 3, "requests": 40,
+              "kernels": {"fibonacci": (1000, 5), "memcpy": (512, 4), "bubble_sort": (50, 1)}},
+}
+
+RiscvEngines = [riscv.computer.Engines.INTERPRETER, riscv.computer.Engines.COMPILED, riscv.computer.Engines.BLOCK]
+
+class Benchmark:
+    # setup() builds the input outside of the timed part, run(state) does the work and returns how many units it did
+    def __init__(self, name, unit, setup, run):
+        self.name = name
+        self.unit = unit
+        self.setup = setup
+        self.run = run
+
+    def measure(self, repeats):
+        samples = []
+        for _ in range(repeats):
+            state = self.setup()
+            start = time.perf_counter()
+            work = self.run(state)
+            samples.append(time.perf_counter()-start)
+        best = min(samples)
+        return {"unit": self.unit, "rate": work/best, "work": work, "seconds": best, "samples": samples}
+
+def _converted(lines, errors):
+    # Generated programs are valid, an error here is a bug in the generator or the assembler
+    if(errors):
+        raise ValueError(f"Benchmark input has {len(errors)} errors, the first: {errors[0]!r}")
+    return len(lines)
+
+def conversion_benchmarks(sizes):
+    riscvWords = random_riscv_words(sizes["words"])
+    armWords = random_arm_words(sizes["words"])
+    riscvText = "\n".join(riscv.computer.riscv_check_word(word)[0] for word in riscvWords)
+    armText = "\n".join(arm.computer.check_word(word)[0] for word in armWords)
+    inputs = {
+        ("riscv", "random"):  (riscvText, words_to_hex(riscvWords)),
+        ("riscv", "listing"): (riscv_listing(sizes["listing"]), None),
+        ("arm", "random"):    (armText, words_to_hex(armWords)),
+        ("arm", "listing"):   (arm_listing(sizes["listing"]), None),
+    }
+    assembleChecked = {"riscv": riscv.computer.riscv_assemble_checked, "arm": arm.computer.assemble_checked}
+    disassembleChecked = {"riscv": riscv.computer.riscv_disassemble_checked, "arm": arm.computer.disassemble_checked}
+    assemble = {"riscv": riscv.computer.riscv_assemble, "arm": arm.computer.assemble}
+    disassemble = {"riscv": riscv.computer.riscv_disassemble, "arm": arm.computer.disassemble}
+    for (arch, kind),(text, hexText) in inputs.items():
+        _converted(*assembleChecked[arch](text.split("\n")))
+        yield Benchmark(f"assemble.{arch}.{kind}", "lines/s", lambda text=text: text,
+                        lambda text, arch=arch: assemble[arch](text).count("\n")+1)
+        yield Benchmark(f"assemble.{arch}.{kind}.checked", "lines/s", lambda text=text: text.split("\n"),
+                        lambda lines, arch=arch: _converted(*assembleChecked[arch](lines)))
+        if(hexText is not None):
+            _converted(*disassembleChecked[arch](hexText.split("\n")))
+            yield Benchmark(f"disassemble.{arch}.{kind}", "lines/s", lambda hexText=hexText: hexText,
+                            lambda hexText, arch=arch: disassemble[arch](hexText).count("\n")+1)
+            yield Benchmark(f"disassemble.{arch}.{kind}.checked", "lines/s", lambda hexText=hexText: hexText.split("\n"),
+                            lambda lines, arch=arch: _converted(*disassembleChecked[arch](lines)))
+
+def _executed(result):
+    if(result.reason != StopReasons.HALT):
+        raise ValueError(f"Benchmark kernel didn't halt: {result!r}")
+    return result.instructions
+
+def _loadedComputer(Computer, program, **options):
+    comp = Computer(trace=TraceLevels.NONE, **options)
+    comp.compile_from_assembly(program)
+    return comp
+
+def run_benchmarks(sizes):
+    # Instructions/s of Computer.run, the decode caches start empty in every repeat
+    for name,(size, repeats) in sizes["kernels"].items():
+        program = riscv_kernel(name, size, repeats)
+        for engine in RiscvEngines:
+            yield Benchmark(f"run.riscv.{name}.{engine}", "instructions/s",
+                            lambda program=program, engine=engine: _loadedComputer(riscv.computer.Computer, program, engine=engine),
+                            lambda comp: _executed(comp.run()))
+        program = arm_kernel(name, size, repeats)
+        yield Benchmark(f"run.arm.{name}.interpreter", "instructions/s",
+                        lambda program=program: _loadedComputer(arm.computer.Computer, program),
+                        lambda comp: _executed(comp.run()))
+
+def http_benchmarks(sizes):
+    # Requests/s through the Flask app with its test client, no sockets. "warm" posts one body again and again
+    # (answered from the request cache), "cold" clears every cache before each request
+    try:
+        import flask_server
+    except ImportError as e:
+        print(f"Skipping the HTTP benchmarks: {e}", file=sys.stderr)
+        return
+    client = flask_server.create_app().test_client()
+    riscvSource = riscv_kernel("bubble_sort", 10)
+    armSource = arm_kernel("bubble_sort", 10)
+    bodies = {
+        "riscv/assemble_api":    riscvSource,
+        "riscv/disassemble_api": riscv.computer.riscv_assemble(riscvSource),
+        "arm/assemble_api":      armSource,
+        "arm/disassemble_api":   arm.computer.assemble(armSource),
+    }
+    count = sizes["requests"]
+
+    def post(path, body, cold):
+        for _ in range(count):
+            if(cold):
+                flask_server.requestCache.clear()
+                for cache in flask_server.lineCaches.values():
+                    cache.clear()
+            response = client.post(path, data=body)
+            if(response.status_code != 200):
+                raise ValueError(f"{path} answered {response.status_code}")
+        return count
+
+    for endpoint,body in bodies.items():
+        for variant in ["warm", "cold"]:
+            yield Benchmark(f"http.{endpoint.replace('/', '.')}.{variant}", "requests/s", lambda body=body: body.encode("utf-8"),
+                            lambda body, endpoint=endpoint, cold=variant == "cold": post("/" + endpoint, body, cold))
+
+def git_commit():
+    # (HEAD, dirty) of the tree next to this file, (None, None) outside of a git checkout
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, len(status.strip()) > 0
+
+def run_all(sizes, nameFilter=""):
+    results = {}
+    for group in [conversion_benchmarks, run_benchmarks, http_benchmarks]:
+        for benchmark in group(sizes):
+            if(nameFilter not in benchmark.name):
+                continue
+            result = benchmark.measure(sizes["repeats"])
+            results[benchmark.name] = result
+            print(f"{benchmark.name:40} {result['rate']:14,.0f} {benchmark.unit}", file=sys.stderr)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the assemblers, disassemblers, simulators and HTTP routes")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs and fewer repeats, for a smoke test")
+    parser.add_argument("--output", help="file for the results JSON, stdout if not given")
+    parser.add_argument("--filter", default="", help="only the benchmarks with this text in their name")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    report = {"commit": commit, "dirty": dirty, "python": platform.python_version(), "platform": platform.platform(),
+              "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "quick": args.quick,
+              "results": run_all(Sizes["quick" if args.quick else "full"], args.filter)}
+    if(args.output):
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
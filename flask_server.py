@@ -1,41 +1,188 @@
 #!/usr/bin/env python3
 # pip install flask
 
+import hashlib
+
 import riscv
 import arm
+from server_cache import LRUCache
+from server_documents import IncrementalAssembly, IncrementalDocument
+from server_batch import run_batch_jobs, convert_job
+
+from flask import Flask, Blueprint, render_template, request, jsonify
+
+REQUEST_CACHE_SIZE = 1024       # Whole responses
+REQUEST_CACHE_BYTES = 16<<20    # And their total size, per worker process
+REQUEST_CACHE_MAX_BODY = 1<<18  # Bigger request bodies are converted but not cached as a whole
+LINE_CACHE_SIZE = 1<<16         # Source lines / instruction words per endpoint
+DOCUMENT_CACHE_SIZE = 4096      # Editor buffers kept for /<arch>/incremental_api
+MAX_REQUEST_BYTES = 4<<20       # Bigger bodies are rejected with 413
+
+def response_size(response):
+    # Characters of a requestCache entry, the text response or the checked_response result. Keys are digests
+    if( isinstance(response, str) ):
+        return len(response)
+    return len(response["output"]) + sum(len(error["source"])+len(error["message"]) for error in response["errors"])
+
+requestCache = LRUCache(REQUEST_CACHE_SIZE, REQUEST_CACHE_BYTES, response_size)
+lineCaches = {
+    "riscv/assemble":    LRUCache(LINE_CACHE_SIZE),
+    "riscv/disassemble": LRUCache(LINE_CACHE_SIZE),
+    "arm/assemble":      LRUCache(LINE_CACHE_SIZE),
+    "arm/disassemble":   LRUCache(LINE_CACHE_SIZE),
+}
+documents = LRUCache(DOCUMENT_CACHE_SIZE)
+
+# Document of each incremental API endpoint
+# Assembly resolves labels, so an edit can change the output of other lines
+documentTypes = {
+    "riscv/assemble":    lambda: IncrementalAssembly(riscv.computer.RiscvIsa, lineCaches["riscv/assemble"]),
+    "riscv/disassemble": lambda: IncrementalDocument(lambda lines: (riscv.computer.riscv_disassemble_hex_line(line, lineCaches["riscv/disassemble"]) for line in lines), True),
+    "arm/assemble":      lambda: IncrementalAssembly(arm.computer.ArmIsa, lineCaches["arm/assemble"]),
+    "arm/disassemble":   lambda: IncrementalDocument(lambda lines: (arm.computer.disassemble_hex_line(line, lineCaches["arm/disassemble"]) for line in lines), True),
+}
+
+routes = Blueprint('routes', __name__)
 
-from flask import Flask, render_template, request, jsonify
+def cached_response(endpoint, convert):
+    # Classroom traffic posts nearly identical buffers, identical bodies are answered from requestCache
+    # and convert() only assembles the lines lineCaches hasn't seen
+    if( request.args.get("format") == "json" ):
+        return checked_response(endpoint)
+    body = request.data
+    if( len(body) > REQUEST_CACHE_MAX_BODY ):
+        return convert(body.decode('utf-8'), lineCaches[endpoint])
+    key = (endpoint, hashlib.blake2b(body, digest_size=16).digest())
+    response = requestCache.get(key)
+    if(response is None):
+        response = convert(body.decode('utf-8'), lineCaches[endpoint])
+        requestCache[key] = response
+    return response
 
-app = Flask(__name__, template_folder='./html')
+def checked_response(endpoint):
+    # ?format=json: {"ok": ..., "output": text, "errors": [{"line", "column", "message", "source"}, ...]}
+    # Same conversion as a /<arch>/batch job, without the worker processes
+    arch, op = endpoint.split("/")
+    body = request.data
+    key = (endpoint, "json", hashlib.blake2b(body, digest_size=16).digest())
+    result = requestCache.get(key) if len(body) <= REQUEST_CACHE_MAX_BODY else None
+    if(result is None):
+        result = convert_job(arch, {"op": op, "program": body.decode('utf-8')})
+        del result["id"]
+        if( len(body) <= REQUEST_CACHE_MAX_BODY ):
+            requestCache[key] = result
+    return jsonify(result)
 
-@app.route('/')
+def incremental_response(arch):
+    # Request:  {"doc": id, "op": "assemble"|"disassemble", "full": true, "lines": [...]}  to (re)send the whole buffer
+    #           {"doc": id, "op": ..., "start": s, "end": e, "lines": [...]}  source lines [s, e) were replaced by lines
+    # Response: {"start": s, "end": e, "lines": [...]}  replace output lines [s, e) with lines
+    #           {"full": true, "lines": [...]}  the whole output
+    # "lines" has one element per source line. An assembly line of several words (a pseudo-instruction expansion,
+    # ".word a, b") has them separated by "\n" in its element, so "\n".join(lines) is the assemble_api text
+    body = request.get_json(force=True, silent=True)
+    if( not isinstance(body, dict) ):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    endpoint = f"{arch}/{body.get('op', 'assemble')}"
+    if(endpoint not in documentTypes):
+        return jsonify({"error": f"Unknown op '{body.get('op')}'"}), 400
+    lines = body.get("lines", [])
+    if( not isinstance(lines, list) or not all(isinstance(line, str) for line in lines) ):
+        return jsonify({"error": "\"lines\" must be an array of strings"}), 400
+    key = (endpoint, str(body.get("doc")))
+    if(body.get("full")):
+        document = documentTypes[endpoint]()
+        documents[key] = document
+        _, _, lines = document.replace(0, 0, lines)
+        return jsonify({"full": True, "lines": lines})
+    start, end = body.get("start"), body.get("end")
+    if( not all(isinstance(value, int) and not isinstance(value, bool) for value in (start, end)) ):
+        return jsonify({"error": "\"start\" and \"end\" must be integers"}), 400
+    document = documents.get(key)
+    if(document is None):
+        return jsonify({"error": "Unknown document, send the whole buffer with \"full\": true"}), 409
+    try:
+        start, end, lines = document.replace(start, end, lines)
+    except ValueError as e:  # Range outside of the document
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"start": start, "end": end, "lines": lines})
+
+def batch_response(arch):
+    # Request:  [{"id": ..., "op": "assemble"|"disassemble", "program": text}, ...]
+    # Response: {"results": [...]} in job order, see server_batch.py
+    jobs = request.get_json(force=True, silent=True)
+    if( not isinstance(jobs, list) ):
+        return jsonify({"error": "Body must be a JSON array of jobs"}), 400
+    return jsonify({"results": run_batch_jobs(arch, jobs)})
+
+@routes.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/riscv/assemble_api', methods=['POST'])
+@routes.route('/riscv/assemble_api', methods=['POST'])
 def riscv_assemble_api():
-    data = request.data.decode('utf-8')
-    return riscv.computer.riscv_assemble(data)
+    return cached_response("riscv/assemble",
+        lambda data,cache: "\n".join(riscv.computer.riscv_assemble_lines(data.split("\n"), cache)))
 
-@app.route('/riscv/disassemble_api', methods=['POST'])
+@routes.route('/riscv/disassemble_api', methods=['POST'])
 def riscv_disassemble_api():
-    data = request.data.decode('utf-8')
-    return riscv.computer.riscv_disassemble(data)
+    return cached_response("riscv/disassemble",
+        lambda data,cache: "\n".join(riscv.computer.riscv_disassemble_lines(data.split("\n"), cache)))
 
 
 
-@app.route('/arm/assemble_api', methods=['POST'])
+@routes.route('/arm/assemble_api', methods=['POST'])
 def arm_assemble_api():
-    data = request.data.decode('utf-8')
-    return arm.computer.assemble(data)
+    return cached_response("arm/assemble",
+        lambda data,cache: "\n".join(arm.computer.assemble_lines(data.split("\n"), cache)))
 
-@app.route('/arm/disassemble_api', methods=['POST'])
+@routes.route('/arm/disassemble_api', methods=['POST'])
 def arm_disassemble_api():
-    data = request.data.decode('utf-8')
-    return arm.computer.disassemble(data)
+    return cached_response("arm/disassemble",
+        lambda data,cache: "\n".join(arm.computer.disassemble_lines(data.split("\n"), cache)))
 
 
 
-if __name__ == '__main__':
-    app.run(host='127.0.0.1', port=8765, debug=True)
+@routes.route('/riscv/incremental_api', methods=['POST'])
+def riscv_incremental_api():
+    return incremental_response("riscv")
+
+@routes.route('/arm/incremental_api', methods=['POST'])
+def arm_incremental_api():
+    return incremental_response("arm")
+
+
 
+@routes.route('/riscv/batch', methods=['POST'])
+def riscv_batch():
+    return batch_response("riscv")
+
+@routes.route('/arm/batch', methods=['POST'])
+def arm_batch():
+    return batch_response("arm")
+
+
+
+@routes.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"request": requestCache.stats(), **{name: cache.stats() for name,cache in lineCaches.items()}})
+
+
+
+def warmup():
+    # Touches the decode/encode tables and code paths once, so the first real request of a worker isn't slower
+    riscv.computer.riscv_disassemble(riscv.computer.riscv_assemble("addi x1, x0, 1\nsw x1, 4(x2)\nbeq x1, x2, -8"))
+    arm.computer.disassemble(arm.computer.assemble("ADD R1, R2, R3"))
+
+def create_app():
+    app = Flask(__name__, template_folder='./html')
+    app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+    app.register_blueprint(routes)
+    warmup()
+    return app
+
+
+
+if __name__ == '__main__':
+    # Development server, see gunicorn.conf.py for production
+    create_app().run(host='127.0.0.1', port=8765, debug=True)
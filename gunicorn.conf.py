@@ -0,0 +1,36 @@
+# pip install gunicorn
+# gunicorn -c gunicorn.conf.py wsgi:app
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:8765"
+
+# Assembling is CPU bound Python, so one process per core does the work and a few threads per worker
+# overlap the network I/O of keep-alive connections
+workers = multiprocessing.cpu_count()
+worker_class = "gthread"
+threads = 4
+keepalive = 5  # Seconds an idle keep-alive connection is held open
+
+# Every worker starts its own batch pool (server_batch.py). cpu_count processes each would be cpu_count² in all,
+# an even share of the cores is 1 with a worker per core and 1 turns the pool off. So each worker gets at least 2,
+# at most 2×cores pool processes, busy only while big batches run. Read when the preloaded app imports
+# server_batch, set BATCH_WORKERS to override
+os.environ.setdefault("BATCH_WORKERS", str(max(2, multiprocessing.cpu_count() // workers)))
+
+# The app (and the riscv/arm tables) is imported once in the master and shared by the forked workers
+preload_app = True
+
+# Request size limits, bodies are limited by MAX_REQUEST_BYTES in flask_server.py
+limit_request_line = 8190
+limit_request_fields = 50
+limit_request_field_size = 8190
+
+timeout = 30
+max_requests = 100000  # Recycle workers now and then, caches are per worker
+max_requests_jitter = 10000
+
+def post_worker_init(worker):
+    import flask_server
+    flask_server.warmup()
@@ -0,0 +1,3 @@
+from . import helper_utils
+from . import assembler
+from . import computer
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+
+import struct
+from collections import deque
+
+from isa.helper_utils import *
+
+U32 = struct.Struct("<I")
+
+class AssemblyError:
+    # A line the checked assembler/disassembler couldn't convert, line and column count from 1
+    def __init__(self, line, column, message, source=""):
+        self.line = line
+        self.column = column
+        self.message = message
+        self.source = source
+    
+    def toDict(self):
+        return {"line": self.line, "column": self.column, "message": self.message, "source": self.source}
+    
+    def __repr__(self):
+        return f"AssemblyError(line={self.line}, column={self.column}, message={self.message!r})"
+
+class AssembledProgram:
+    # Result of Isa.assembleProgram
+    def __init__(self):
+        self.text = array("I")       # InstructionMemory image, one word per .text address
+        self.data = bytearray()      # DataMemory image of .data, starting at address 0
+        self.symbols = SymbolTable()
+        self.listing = []            # Output per source line, the assemble_lines text
+        self.errors = []             # AssemblyError per bad line
+
+def word2HexLine(inst_hex):
+    # "03 10 82 E0" line of a little-endian instruction word
+    hex_str = f"{inst_hex:08X}"
+    return hex_str[6:8]+" "+hex_str[4:6]+" "+hex_str[2:4]+" "+hex_str[0:2] # Reverse byte order
+
+class Isa:
+    # The assembler and disassembler loops of every architecture, an architecture only plugs in
+    #   checkInstruction(body, symbols, pc) -> (word, None, None) or (None, column, message), column is 0-based in body.
+    #                                          body has no label or comment, symbols is a SymbolTable or None
+    #   checkWord(word) -> (text, None) or (None, message)
+    #   commentMarkers: strings that start a comment
+    #   expandPseudo(body) -> None if body isn't a pseudo-instruction, (base instruction texts, None, None)
+    #                         or (None, column, message) otherwise
+    def __init__(self, name, checkInstruction, checkWord, commentMarkers, expandPseudo=None):
+        self.name = name
+        self.checkInstruction = checkInstruction
+        self.checkWord = checkWord
+        self.commentMarkers = commentMarkers
+        self.expandPseudo = expandPseudo or (lambda body: None)
+    
+    def stripComment(self, line):
+        for marker in self.commentMarkers:
+            if(marker in line): line = line.split(marker)[0]
+        return line
+    
+    # Assembly
+    def assembleLines(self, lines, lineCache=None):
+        # Yields one output line (without newline) per input line, lines can be any iterable such as an open file
+        # Output streams while every label a line uses is already defined. A line that uses a label defined further
+        # down waits (with the lines after it) until that label has been read, at worst until the end of the input
+        # lineCache (dict, LRUCache...) keeps encoded instructions, see assembleProgram
+        if( isinstance(lines, (list, tuple)) ):  # Already read, the plain two passes are faster than streaming
+            yield from self.assembleProgram(lines, lineCache).listing
+            return
+        program = AssembledProgram()  # Scratch, only the listing line of each statement is kept
+        symbols = program.symbols
+        pending = deque()  # (lineNumber, statement) from the first forward reference on
+        blockedAt = None   # len(symbols) when the first pending line last used an undefined label
+        for lineNumber,statement in enumerate(self._assignAddresses(lines, symbols), 1):
+            if(not pending):
+                output = self._encodeStreamed(lineNumber, statement, program, lineCache, False)
+                if(output is not None):
+                    yield output
+                    continue
+                blockedAt = len(symbols)
+            pending.append((lineNumber, statement))
+            if(blockedAt == len(symbols)):
+                continue
+            blockedAt = None
+            while(pending):
+                output = self._encodeStreamed(*pending[0], program, lineCache, False)
+                if(output is None):
+                    blockedAt = len(symbols)
+                    break
+                pending.popleft()
+                yield output
+        for lineNumber,statement in pending:
+            yield self._encodeStreamed(lineNumber, statement, program, lineCache, True)
+    
+    def _encodeStreamed(self, lineNumber, statement, program, lineCache, final):
+        # Listing line of one statement, None if it used an undefined label and final is False
+        misses = program.symbols.misses
+        self._encodeStatement(lineNumber, statement, program, lineCache)
+        output = program.listing.pop()
+        if(lineNumber % 1024 == 0):
+            del program.text[:]
+            program.data.clear()
+            program.errors.clear()
+        if( not final and program.symbols.misses != misses ):
+            return None
+        return output
+    
+    def assembleLine(self, line):
+        # "" for empty lines, "ERROR" if the line can't be assembled on its own
+        return self.assembleProgram([line]).listing[0]
+    
+    def checkLine(self, line):
+        # (word, None, None), (None, None, None) for empty lines or (None, column, message) with a 1-based column of line
+        code = self.stripComment(line)
+        labelEnd = code.rfind(":")+1
+        body = code[labelEnd:]
+        if( len(body.strip()) == 0 ):
+            return None, None, None
+        inst_hex, column, message = self.checkInstruction(body, None, 0)
+        if(message is not None):
+            return None, labelEnd+column+1, message
+        return inst_hex, None, None
+    
+    def encodeLine(self, line):
+        # Instruction word of a source line, None for empty lines. Raises ValueError if the line can't be assembled
+        inst_hex, column, message = self.checkLine(line)
+        if(message is not None):
+            raise ValueError(message)
+        return inst_hex
+    
+    def assembleChecked(self, lines, lineCache=None):
+        # (outputLines, errors): the assembleLines output and an AssemblyError per bad line, nothing raises or prints
+        program = self.assembleProgram(lines, lineCache)
+        return program.listing, program.errors
+    
+    def assembleBytes(self, assembly_str):
+        # Flat little-endian .text image, write it to a .bin file as is. Raises ValueError on the first bad line
+        return words2Bytes(self.assembleOrRaise(assembly_str).text)
+    
+    def assembleOrRaise(self, assembly_str):
+        # AssembledProgram of a whole source text, raises ValueError on the first bad line
+        program = self.assembleProgram(assembly_str.split("\n"))
+        if(program.errors):
+            error = program.errors[0]
+            raise ValueError(f"Line {error.line}, column {error.column}: {error.message}")
+        return program
+    
+    def assembleProgram(self, lines, lineCache=None):
+        # Two-pass assembler, linear in the number of lines. The first pass gives every line its section and address
+        # and fills the SymbolTable, the second one encodes instructions and .word values with every label known
+        # lineCache maps instruction text to (word, column, message), only lines that don't refer to labels are kept
+        program = AssembledProgram()
+        statements = list(self._assignAddresses(lines, program.symbols))
+        for lineNumber,statement in enumerate(statements, 1):
+            self._encodeStatement(lineNumber, statement, program, lineCache)
+        return program
+    
+    def _assignAddresses(self, lines, symbols, position=None):
+        # First pass, yields (line, kind, section, address, body, column, message) per source line, column is where body
+        # (or the problem, if kind is "error") starts in line. The body of a "pseudo" line is its list of base instructions
+        # Labels are defined in symbols as their line is reached
+        # position is the section and the next address of every section, {"section": ".text", ".text": 0, ".data": 0}
+        # at the start of a program, and is left as it is after the last line
+        if(position is None):
+            position = {"section": ".text", ".text": 0, ".data": 0}
+        assignLine = self._assignLine
+        for line in lines:
+            yield assignLine(line, symbols, position)
+    
+    def _assignLine(self, line, symbols, position):
+        # First pass of one line, see _assignAddresses
+        section = position["section"]
+        code = self.stripComment(line)
+        column = 0
+        while(":" in code):  # Label definitions
+            match = LabelPattern.match(code)
+            if(match is None):
+                return (line, "error", section, position[section], None, column+len(code)-len(code.lstrip()), "Invalid label")
+            if( not symbols.define(match.group(1), section, position[section]) ):
+                return (line, "error", section, position[section], None, column+match.start(1), f"Label '{match.group(1)}' is already defined")
+            column += match.end()
+            code = code[match.end():]
+        
+        body = code.strip()
+        column += len(code)-len(code.lstrip())
+        kind = None
+        size = 0
+        message = None
+        if( len(body) == 0 ):
+            pass
+        elif(body[0] == "."):
+            directive, _, args = body.partition(" ")
+            directive = directive.lower()
+            if(directive in [".text", ".data"]):
+                section = position["section"] = directive
+                if( len(args.strip()) != 0 ):
+                    kind, message = "error", f"{directive} takes no operands"
+            elif(directive == ".word"):
+                kind = "word"
+                size = 4*(args.count(",")+1)
+                if( len(args.strip()) == 0 ):
+                    kind, message = "error", ".word needs at least one value"
+            elif(directive not in [".globl", ".global"]):
+                kind, message = "error", f"Unknown directive '{directive}'"
+        elif(section != ".text"):
+            kind, message = "error", f"Instructions must be in .text, not {section}"
+        else:
+            # Pseudo-instructions are expanded here, so every later address and label already accounts for the extra instructions
+            expanded = self.expandPseudo(body)
+            if(expanded is None):
+                kind = "instruction"
+                size = 4
+            else:
+                expansion, expansionColumn, message = expanded
+                if(message is not None):
+                    kind = "error"
+                    column += expansionColumn
+                else:
+                    kind, body = "pseudo", expansion
+                    size = 4*len(expansion)
+        address = position[section]
+        position[section] = address+size
+        return (line, kind, section, address, body, column, message)
+    
+    def _encodeStatement(self, lineNumber, statement, program, lineCache):
+        # Second pass of one statement, appends to program.text, program.data, program.listing and program.errors
+        symbols = program.symbols
+        line, kind, section, address, body, column, message = statement
+        if(kind == "instruction"):
+            inst_hex, bodyColumn, message = self._encodeInstruction(body, symbols, address, lineCache)
+            if(message is not None):
+                program.text.append(0)
+                program.listing.append("ERROR")
+                program.errors.append(AssemblyError(lineNumber, column+bodyColumn+1, message, line))
+                return
+            program.text.append(inst_hex)
+            program.listing.append(word2HexLine(inst_hex))
+        elif(kind == "pseudo"):
+            words = []
+            for index,instruction in enumerate(body):
+                inst_hex, _, message = self._encodeInstruction(instruction, symbols, address+4*index, lineCache)
+                if(message is not None):
+                    program.errors.append(AssemblyError(lineNumber, column+1, f"{message} (in '{instruction}')", line))
+                    break
+                words.append(inst_hex)
+            if(message is not None):
+                program.text.extend([0]*len(body))
+                program.listing.append("ERROR")
+                return
+            program.text.extend(words)
+            program.listing.append("\n".join(word2HexLine(word) for word in words))
+        elif(kind == "word"):
+            words = []
+            valid = True
+            offset = len(".word")+1
+            for field in body[offset:].split(","):
+                value, message = symbols.evaluate(field)
+                if(message is None and not (-(1<<31) <= value < (1<<32)) ):
+                    message = "Value doesn't fit to 32 bits"
+                if(message is not None):
+                    program.errors.append(AssemblyError(lineNumber, column+offset+len(field)-len(field.lstrip())+1, message, line))
+                    value = 0
+                    valid = False
+                words.append(value & 0xFFFFFFFF)
+                offset += len(field)+1
+            if(section == ".data"):
+                program.data += words2Bytes(words)
+                program.listing.append("" if valid else "ERROR")
+            else:  # Raw words in the instruction stream, one listing line each so disassembler addresses stay right
+                program.text.extend(words)
+                program.listing.append("\n".join(word2HexLine(word) for word in words) if valid else "ERROR")
+        elif(kind == "error"):
+            program.listing.append("ERROR")
+            program.errors.append(AssemblyError(lineNumber, column+1, message, line))
+        else:
+            program.listing.append("")
+    
+    def _encodeInstruction(self, body, symbols, pc, lineCache):
+        # (word, column, message) of a base instruction at pc
+        result = None if lineCache is None else lineCache.get(body)
+        if(result is None):
+            lookups = symbols.lookups
+            result = self.checkInstruction(body, symbols, pc)
+            if(lineCache is not None and symbols.lookups == lookups):
+                lineCache[body] = result
+        return result
+    
+    # Disassembly
+    def disassembleLines(self, lines, wordCache=None):
+        # Yields one output line (without newline) per input line, lines can be any iterable such as an open file
+        # wordCache (dict, LRUCache...) maps instruction words to their text
+        address=0
+        for line in lines:
+            text = self.disassembleHexLine(line, wordCache)
+            if(text is None):
+                yield ""
+                continue
+            yield f"_{address:02X}: " + text
+            address += 4
+    
+    def disassembleHexLine(self, line, wordCache=None):
+        # None for empty lines (they don't take an address), otherwise the text after the address prefix
+        inst_hex, column, message = checkHexLine(line)
+        if(message is not None):
+            return "ERROR"
+        if(inst_hex is None):
+            return None
+        if(wordCache is None):
+            return self.disassembleWord(inst_hex)
+        text = wordCache.get(inst_hex)
+        if(text is None):
+            text = self.disassembleWord(inst_hex)
+            wordCache[inst_hex] = text
+        return text
+    
+    def disassembleWord(self, inst_hex):
+        # "ERROR" if the word isn't a known instruction
+        text, message = self.checkWord(inst_hex)
+        if(message is not None):
+            return "ERROR"
+        return text
+    
+    def decodeWord(self, inst_hex):
+        # Raises ValueError if the word isn't a known instruction
+        text, message = self.checkWord(inst_hex)
+        if(message is not None):
+            raise ValueError(message)
+        return text
+    
+    def disassembleChecked(self, lines, wordCache=None):
+        # (outputLines, errors) like assembleChecked, wordCache maps words to (text, message)
+        outputs = []
+        errors = []
+        address = 0
+        for lineNumber,line in enumerate(lines, 1):
+            inst_hex, column, message = checkHexLine(line)
+            if(message is None and inst_hex is None):
+                outputs.append("")
+                continue
+            if(message is None):
+                result = None if wordCache is None else wordCache.get(inst_hex)
+                if(result is None):
+                    result = self.checkWord(inst_hex)
+                    if(wordCache is not None):
+                        wordCache[inst_hex] = result
+                text, message = result
+                column = 1
+            if(message is not None):
+                text = "ERROR"
+                errors.append(AssemblyError(lineNumber, column, message, line))
+            outputs.append(f"_{address:02X}: " + text)
+            address += 4
+        return outputs, errors
+    
+    def disassembleBytesLines(self, program_bytes):
+        # Same output as disassembleLines, words are unpacked from the buffer one at a time so an mmap isn't copied
+        address=0
+        for (inst_hex,) in U32.iter_unpack(wordBytes(program_bytes)):
+            yield f"_{address:02X}: " + self.disassembleWord(inst_hex)
+            address += 4
+
+class _RecordingSymbolTable(SymbolTable):
+    # SymbolTable of an IncrementalProgram, notes the labels a line defines and the names its encoding resolves
+    def __init__(self):
+        super().__init__()
+        self.defined = []      # Names define() added, the caller empties it
+        self.refused = []      # Names define() found already defined
+        self.resolved = set()  # Names resolve() was asked for
+    
+    def define(self, name, section, address):
+        if( not super().define(name, section, address) ):
+            self.refused.append(name)
+            return False
+        self.defined.append(name)
+        return True
+    
+    def undefine(self, name):
+        del self.addresses[name]
+        del self.sections[name]
+    
+    def resolve(self, name):
+        self.resolved.add(name)
+        return super().resolve(name)
+
+class IncrementalProgram:
+    # Listing of a source buffer edited a few lines at a time, the server's incremental API keeps one per document
+    # Every line keeps its first-pass statement, size, labels and the names its encoding resolved. An edit runs the
+    # first pass over the new lines only, moves the labels after them by the size difference and encodes again the
+    # new lines, the lines that resolve a label that moved, appeared or went away and, as their pc moved, the lines
+    # after the edit that resolve labels (a PC-relative offset can change). A line that doesn't resolve labels doesn't
+    # depend on its address and keeps its listing line, its stored address may then be out of date
+    # The whole buffer is assembled again, like assembleProgram does, when more than a quarter of the lines would be
+    # encoded again, when the edit changes the section of the lines after it or which definition of a label counts
+    def __init__(self, isa, lineCache=None):
+        self.isa = isa
+        self.lineCache = lineCache
+        self._assembleAll([])
+    
+    def replace(self, start, end, lines):
+        # Replaces source lines [start, end) with lines. Returns (first, stop, outputs): the listing lines [first, stop)
+        # before the edit become outputs. Raises ValueError if the range is outside of the buffer
+        if( not (0 <= start <= end <= len(self.sources)) ):
+            raise ValueError(f"Line range [{start}, {end}) is outside of the document ({len(self.sources)} lines)")
+        lines = list(lines)
+        symbols = self.symbols
+        removed = {name for names in self.labels[start:end] for name in names}
+        if( not removed.isdisjoint(self.redefined) ):  # A later definition of the label can count now
+            return self._replaceAll(start, end, lines)
+        section = self.sectionsAfter[start-1] if start > 0 else ".text"
+        position = {"section": section, ".text": sum(self.textSizes[:start]), ".data": sum(self.dataSizes[:start])}
+        textEnd = position[".text"]+sum(self.textSizes[start:end])
+        dataEnd = position[".data"]+sum(self.dataSizes[start:end])
+        sectionEnd = self.sectionsAfter[end-1] if end > start else section
+        oldLabels = {name: (symbols.addresses[name], symbols.sections[name]) for name in removed}
+        for name in removed:
+            symbols.undefine(name)
+            del self.labelLines[name]
+        
+        assigned = self._assign(lines, position)
+        defined = {name for names in assigned[4] for name in names}
+        if( not defined.issuperset(symbols.refused) ):  # Defined out of the edit, which definition counts depends on the order
+            return self._replaceAll(start, end, lines)
+        self.redefined.update(symbols.refused)
+        if( end < len(self.sources) and position["section"] != sectionEnd ):  # Every line after the edit changes section
+            return self._replaceAll(start, end, lines)
+        
+        # Labels after the edit move with the lines, by the size difference of their section
+        delta = {".text": position[".text"]-textEnd, ".data": position[".data"]-dataEnd}
+        lineDelta = len(lines)-(end-start)
+        changed = removed ^ defined  # Labels that appeared or went away, and the ones defined again elsewhere
+        changed.update(name for name in removed & defined if oldLabels[name] != (symbols.addresses[name], symbols.sections[name]))
+        if(lineDelta or delta[".text"] or delta[".data"]):
+            for name,index in self.labelLines.items():
+                if(index >= end):
+                    self.labelLines[name] = index+lineDelta
+                    shift = delta[symbols.sections[name]]
+                    if(shift):
+                        symbols.addresses[name] += shift
+                        changed.add(name)
+        for index,names in enumerate(assigned[4], start):
+            for name in names:
+                self.labelLines[name] = index
+        
+        stop = start+len(lines)
+        for column,values in zip((self.statements, self.textSizes, self.dataSizes, self.sectionsAfter, self.labels), assigned):
+            column[start:end] = values
+        self.sources[start:end] = lines
+        self.uses[start:end] = [None]*len(lines)
+        dirty = set()
+        if(changed):
+            dirty.update(index for index,uses in enumerate(self.uses) if uses is not None and not changed.isdisjoint(uses))
+        moved = {name for name,shift in delta.items() if shift}
+        if(moved):
+            statements = self.statements
+            dirty.update(index for index in range(stop, len(self.uses)) if self.uses[index] is not None and statements[index][2] in moved)
+        if( len(dirty) > len(self.sources)//4 ):
+            return self._replaceAll(start, end, lines, False)
+        
+        outputs = [self._encode(index) for index in range(start, stop)]
+        changedLines = {}
+        for index in dirty:
+            if(index >= stop):
+                statement = self.statements[index]
+                shift = delta[statement[2]]
+                if(shift):  # Lines that resolve labels keep their address up to date
+                    self.statements[index] = statement[:3]+(statement[3]+shift,)+statement[4:]
+            output = self._encode(index)
+            if(output != self.listing[index if index < start else index-lineDelta]):
+                changedLines[index] = output
+        self.listing[start:end] = outputs
+        for index,output in changedLines.items():
+            self.listing[index] = output
+        first = min((start, *changedLines))
+        last = max((stop, *(index+1 for index in changedLines)))
+        return first, last-lineDelta, self.listing[first:last]
+    
+    def _replaceAll(self, start, end, lines, replaced=True):
+        # replace() by assembling the whole buffer again, only the changed listing range is returned
+        if(replaced):
+            self.sources[start:end] = lines
+        oldListing = self.listing
+        self._assembleAll(self.sources)
+        listing = self.listing
+        first = 0
+        limit = min(len(listing), len(oldListing))
+        while(first < limit and listing[first] == oldListing[first]):
+            first += 1
+        last = 0
+        while(last < limit-first and listing[-1-last] == oldListing[-1-last]):
+            last += 1
+        return first, len(oldListing)-last, listing[first:len(listing)-last]
+    
+    def _assembleAll(self, lines):
+        self.sources = list(lines)
+        self.symbols = _RecordingSymbolTable()
+        self.scratch = AssembledProgram()  # _encode() output, only the listing line is kept
+        self.scratch.symbols = self.symbols
+        self.labelLines = {}     # Label -> index of the line that defines it
+        self.redefined = set()   # Labels with a refused second definition
+        assigned = self._assign(self.sources, {"section": ".text", ".text": 0, ".data": 0})
+        self.statements, self.textSizes, self.dataSizes, self.sectionsAfter, self.labels = assigned
+        self.redefined.update(self.symbols.refused)
+        for index,names in enumerate(self.labels):
+            for name in names:
+                self.labelLines[name] = index
+        self.uses = [None]*len(self.sources)  # Names the encoding of each line resolved, None if it resolved none
+        self.listing = [self._encode(index) for index in range(len(self.sources))]
+    
+    def _assign(self, lines, position):
+        # First pass of lines from position: (statements, textSizes, dataSizes, sectionsAfter, labels) per line
+        symbols = self.symbols
+        symbols.refused.clear()
+        statements, textSizes, dataSizes, sectionsAfter, labels = [], [], [], [], []
+        for line in lines:
+            text, data = position[".text"], position[".data"]
+            statements.append(self.isa._assignLine(line, symbols, position))
+            textSizes.append(position[".text"]-text)
+            dataSizes.append(position[".data"]-data)
+            sectionsAfter.append(position["section"])
+            labels.append(tuple(symbols.defined))
+            symbols.defined.clear()
+        return statements, textSizes, dataSizes, sectionsAfter, labels
+    
+    def _encode(self, index):
+        # Listing line of source line index, notes the names it resolved
+        symbols = self.symbols
+        scratch = self.scratch
+        symbols.resolved.clear()
+        self.isa._encodeStatement(index+1, self.statements[index], scratch, self.lineCache)
+        self.uses[index] = frozenset(symbols.resolved) if symbols.resolved else None
+        del scratch.text[:]
+        scratch.data.clear()
+        scratch.errors.clear()
+        return scratch.listing.pop()
+    
+    def text(self):
+        return "\n".join(self.listing)
+
+def checkHexLine(line):
+    # Word of a "03 10 82 E0" line like Isa.checkLine: (word, None, None), (None, None, None) or (None, column, message)
+    digits=line.strip()
+    digits=digits.replace("_","").replace(" ","")
+    if( len(digits) == 0 ):
+        return None, None, None
+    if( HexWordPattern.fullmatch(digits) is None ):
+        for column,char in enumerate(line, 1):
+            if(char not in HexLineChars):
+                return None, column, f"Invalid hex digit '{char}'"
+        return None, 1, f"Expected 4 hex bytes, got {len(digits)} digits"
+    return int(digits[6:8]+digits[4:6]+digits[2:4]+digits[0:2], 16), None, None # Reverse byte order
+
+def parseHexLine(line):
+    # Instruction word of a "03 10 82 E0" line, None for empty lines. Raises ValueError for malformed lines
+    inst_hex, column, message = checkHexLine(line)
+    if(message is not None):
+        raise ValueError(message)
+    return inst_hex
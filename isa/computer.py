@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+
+import hashlib
+import struct
+import time
+from array import array
+
+from isa.helper_utils import *
+from isa.assembler import parseHexLine
+
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+
+LIMIT_CHECK_INTERVAL = 4096  # Instructions between two checks of run() limits
+CYCLE_CHECK_INTERVAL = 65536  # Instructions between two architectural state samples for cycle detection
+
+class TraceLevels:
+    NONE =   0  # No tracing, nothing is formatted
+    EVENTS = 1  # Append tuples to Computer.traceEvents:
+                #   ("inst", PC, h)  ("rf", reg, data)  ("mem", adr, data, numBytes)  ("pc", next_PC)
+    TEXT =   2  # Print the execution trace to stdout
+
+class StopReasons:
+    HALT =     "halt"      # Zero instruction word fetched
+    BUDGET =   "budget"    # maxInstructions executed
+    DEADLINE = "deadline"  # Wall-clock deadline passed
+    CYCLE =    "cycle"     # Same PC reached again with identical architectural state, the program can't terminate
+
+class RunResult:
+    def __init__(self, reason, instructions, PC):
+        self.reason = reason
+        self.instructions = instructions
+        self.PC = PC
+    
+    def __repr__(self):
+        return f"RunResult(reason={self.reason!r}, instructions={self.instructions}, PC=0x{self.PC:08X})"
+
+class BaseInstruction:
+    # Instruction of every architecture: h is the word, parsed the fields and s the disassembly text
+    # A subclass provides run(computer) and the static functions _checkHex(h) -> (parsed, None) or (None, message),
+    # _checkStr(s, symbols, pc) -> (parsed, None, None) or (None, column, message), _generateHex(parsed) and
+    # _generateStr(parsed)
+    def __init__(self):
+        self.h = 0x00000000       #Readonly value
+        self._s = "NOP;"          #Readonly value (use self.s)
+        self.parsed = ["NOP"]     #Readonly value
+    
+    @property
+    def s(self):
+        if(self._s is None): # Disassembly string is only generated when someone asks for it
+            self._s = type(self)._generateStr(self.parsed)
+        return self._s
+    
+    def fromHex(self, h):
+        self.parsed = type(self)._parseFromHex(h)
+        self._s = None
+        self.h = h
+    
+    def fromStr(self, s):
+        self.parsed = type(self)._parseFromStr(s)
+        self.h = type(self)._generateHex(self.parsed)
+        self._s = s
+    
+    @classmethod
+    def _parseFromHex(cls, h):
+        parsed, message = cls._checkHex(h)
+        if(message is not None):
+            raise ValueError(message)
+        return parsed
+    
+    @classmethod
+    def _parseFromStr(cls, s):
+        parsed, column, message = cls._checkStr(s)
+        if(message is not None):
+            raise ValueError(message)
+        return parsed
+    
+    @classmethod
+    def checkInstruction(cls, body, symbols, pc):
+        # The checkInstruction of isa.assembler.Isa
+        parsed, column, message = cls._checkStr(body, symbols, pc)
+        if(message is not None):
+            return None, column, message
+        return cls._generateHex(parsed), None, None
+    
+    @classmethod
+    def checkWord(cls, inst_hex):
+        # The checkWord of isa.assembler.Isa, (text, None) or (None, message) if the word isn't a known instruction
+        parsed, message = cls._checkHex(inst_hex)
+        if(message is not None):
+            return None, message
+        return cls._generateStr(parsed), None
+
+class BaseComputer:
+    # Program loading, the run loop, DataMemory and copy-on-write state of every architecture's Computer
+    # A subclass sets isa (an isa.assembler.Isa) and instructionClass (a BaseInstruction, decoded with fromHex(),
+    # executed with run(computer)), calls BaseComputer.__init__ and overrides the hooks below for state and caches
+    # of its own. registerNames are the trace names of the registers, zeroRegister the one that ignores writes
+    isa = None
+    instructionClass = None
+    registerNames = []
+    zeroRegister = None
+    
+    def __init__(self, engine, trace, registerCount, dmemSize, imemSize):
+        self.engine = engine
+        self.trace = trace
+        self.traceEvents = []
+        self.PC = 0x00000000  # Program Counter
+        self.RF = [0] * registerCount  # Register File (Registers are always stored unsigned)
+        self.DMem = bytearray(dmemSize)  # Data Memory        (each element is 8-bits)
+        self.IMem = array("I", bytes(4*imemSize))  # Instruction Memory (each element is 32-bits)
+        self.decodeCache = [None] * len(self.IMem)  # Decoded instruction per IMem slot, filled on first fetch
+        self.dmemShared = False  # DMem/IMem are referenced by a Snapshot or another Computer,
+        self.imemShared = False  # they are copied before the first write (copy-on-write)
+        self._resetEngineCaches()
+    
+    # Hooks for subclasses
+    def _savedExtra(self):
+        # Architectural state outside of PC, RF and the memories, kept in a Snapshot. Must be immutable
+        return None
+    
+    def _restoreExtra(self, saved):
+        pass
+    
+    def _resetEngineCaches(self):
+        # Caches bound to this Computer or to the IMem content (compiled code...), dropped when IMem is replaced
+        pass
+    
+    def _instructionWritten(self, slot):
+        # IMem[slot] was rewritten, drop what the engine caches for it
+        pass
+    
+    def clone(self):
+        # Independent copy of the architectural state, decoded instructions are shared
+        # self keeps its sharing flags, a Snapshot or fork may still reference its memories
+        return self._copy(bytearray(self.DMem), array("I", self.IMem), list(self.decodeCache), False)
+    
+    def fork(self):
+        # Like clone(), but memories are shared until one side writes to them
+        self.dmemShared = True
+        self.imemShared = True
+        return self._copy(self.DMem, self.IMem, self.decodeCache, True)  # decodeCache is valid while IMem is the same
+    
+    def _copy(self, DMem, IMem, decodeCache, shared):
+        other = type(self).__new__(type(self))
+        other.engine = self.engine
+        other.trace = self.trace
+        other.traceEvents = []
+        other.PC = self.PC
+        other.RF = list(self.RF)
+        other._restoreExtra(self._savedExtra())
+        other.DMem = DMem
+        other.IMem = IMem
+        other.decodeCache = decodeCache
+        other.dmemShared = shared
+        other.imemShared = shared
+        other._resetEngineCaches()  # Compiled code is bound to its Computer
+        return other
+    
+    def snapshot(self):
+        self.dmemShared = True
+        self.imemShared = True
+        return Snapshot(self)
+    
+    def restore(self, snapshot):
+        self.PC = snapshot.PC
+        self.RF[:] = snapshot.RF  # In place, compiled code holds a reference to RF
+        self._restoreExtra(snapshot.extra)
+        self.DMem = snapshot.DMem
+        self.dmemShared = True
+        if(self.IMem is not snapshot.IMem):
+            self.IMem = snapshot.IMem
+            self.decodeCache = snapshot.decodeCache
+            self._resetEngineCaches()
+        self.imemShared = True
+    
+    def _unshareIMem(self):
+        self.IMem = array("I", self.IMem)
+        self.decodeCache = list(self.decodeCache)
+        self.imemShared = False
+        
+    def invalidateDecodeCache(self):
+        # Must be called whenever IMem is rewritten
+        self.decodeCache = [None] * len(self.IMem)
+        self._resetEngineCaches()
+    
+    def writeInstruction(self, adr, inst_hex):
+        # Rewrites one IMem word, only the caches that cover it are dropped
+        if(self.imemShared):
+            self._unshareIMem()
+        slot = adr//4
+        self.IMem[slot] = inst_hex
+        self.decodeCache[slot] = None
+        self._instructionWritten(slot)
+    
+    def load_program_from_hex(self, program_hex):
+        if(self.imemShared):
+            self._unshareIMem()
+        im_ptr = 0 #Instruction Memory Pointer
+        for line in program_hex.split("\n"):
+            inst_hex = parseHexLine(line)
+            if(inst_hex is None):
+                continue
+            self.IMem[im_ptr//4] = inst_hex
+            im_ptr += 4
+        self.invalidateDecodeCache()
+    
+    def load_program_from_bytes(self, program_bytes):
+        # Flat little-endian image, e.g. the contents of a .bin file, a memoryview or an mmap
+        words = bytes2Words(program_bytes)
+        if( len(words) > len(self.IMem) ):
+            raise ValueError(f"Program of {len(words)} instructions doesn't fit to InstructionMemory")
+        if(self.imemShared):
+            self._unshareIMem()
+        self.IMem[0:len(words)] = words
+        self.invalidateDecodeCache()
+    
+    def compile_from_assembly(self, program_assembly):
+        # Loads .text to InstructionMemory and .data to DataMemory. Raises ValueError on the first bad line
+        program = self.isa.assembleOrRaise(program_assembly)
+        self.load_program_from_bytes(words2Bytes(program.text))
+        if(program.data):
+            self.loadData(0, program.data)
+        
+    def run(self, maxInstructions=None, deadline=None, detectCycles=True):
+        self.PC=0
+        return self.resume(maxInstructions, deadline, detectCycles)
+    
+    def resume(self, maxInstructions=None, deadline=None, detectCycles=True):
+        # Continues from the current PC, e.g. after restore()
+        # Stops at a zero instruction word, after maxInstructions, once time.monotonic() passes deadline,
+        # or when detectCycles finds the program in an endless loop. Returns a RunResult
+        self.traceEvents = []
+        runChunk = self._chunkRunner()
+        executed = 0
+        seenStates = set()
+        untilCycleCheck = CYCLE_CHECK_INTERVAL
+        while(True):
+            limit = LIMIT_CHECK_INTERVAL
+            if(maxInstructions is not None):
+                limit = min(limit, maxInstructions-executed)
+                if(limit <= 0):
+                    reason = StopReasons.BUDGET
+                    break
+            count, halted = runChunk(limit)
+            executed += count
+            if(halted):
+                reason = StopReasons.HALT
+                break
+            if(deadline is not None and time.monotonic() >= deadline):
+                reason = StopReasons.DEADLINE
+                break
+            if(detectCycles):
+                # States are sampled every CYCLE_CHECK_INTERVAL instructions. Execution is deterministic, so once
+                # a sample repeats the program is in a loop it can't leave. A loop of length P is found within
+                # P samples, tight loops within two
+                untilCycleCheck -= count
+                if(untilCycleCheck <= 0):
+                    untilCycleCheck = CYCLE_CHECK_INTERVAL
+                    state = self.stateDigest()
+                    if(state in seenStates):
+                        reason = StopReasons.CYCLE
+                        break
+                    seenStates.add(state)
+        return RunResult(reason, executed, self.PC)
+    
+    def _chunkRunner(self):
+        # Function that runs up to limit instructions, subclasses with more engines choose here
+        return self._runInterpreted
+    
+    def _runInterpreted(self, limit):
+        # Executes at most limit instructions, returns (executed, halted)
+        decodeCache = self.decodeCache
+        trace = self.trace
+        for executed in range(limit):
+            instruction = decodeCache[self.PC//4]
+            if(instruction is None):
+                inst_hex = self.IMem[self.PC//4]
+                if(inst_hex==0x00000000): return executed, True
+                instruction = self.instructionClass()
+                instruction.fromHex(inst_hex)
+                decodeCache[self.PC//4] = instruction
+            if(not trace):
+                instruction.run(self)
+            elif(trace == TraceLevels.EVENTS):
+                self.traceEvents.append( ("inst", self.PC, instruction.h) )
+                instruction.run(self)
+            else:
+                print(f"_{self.PC:02X}: ", end='')
+                print(f"{instruction.s:30}", end='')
+                instruction.run(self)
+                print()
+        return limit, False
+    
+    def stateDigest(self):
+        # Digest of PC, RF, _extraState() and DMem (IMem is not writable by programs)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.PC.to_bytes(8, "little", signed=True))
+        h.update(struct.pack(f"<{len(self.RF)}I", *self.RF))
+        h.update(self._extraState())
+        h.update(self.DMem)
+        return h.digest()
+    
+    def _extraState(self):
+        # Architectural state outside of PC, RF and DMem, as bytes
+        return b""
+    
+    def _unshareDMem(self):
+        self.DMem = bytearray(self.DMem)
+        self.dmemShared = False
+    
+    def readData(self, adr, numBytes=4):
+        DMem = self.DMem
+        memSize = len(DMem)
+        if( 0 <= adr and adr+numBytes <= memSize ):
+            if(numBytes == 4): return U32.unpack_from(DMem, adr)[0]
+            if(numBytes == 1): return DMem[adr]
+            if(numBytes == 2): return U16.unpack_from(DMem, adr)[0]
+        readval=0  # Access wraps around the end of memory
+        for i in range(numBytes):
+            readval |= DMem[(adr+i)%memSize]<<(8*i)
+        return readval
+    
+    def writeData(self, adr, data, numBytes=4):
+        if(self.trace == TraceLevels.TEXT):
+            data_str = f"{data:08X}"
+            print(f"DataMemory[{adr+numBytes-1}:{adr}] <= 0x{data_str[-2*numBytes:]}", end='')
+        elif(self.trace == TraceLevels.EVENTS):
+            self.traceEvents.append( ("mem", adr, data, numBytes) )
+        self.storeData(adr, data, numBytes)
+    
+    def storeData(self, adr, data, numBytes=4):
+        if(self.dmemShared):
+            self._unshareDMem()
+        DMem = self.DMem
+        memSize = len(DMem)
+        if( 0 <= adr and adr+numBytes <= memSize ):
+            if(numBytes == 4): U32.pack_into(DMem, adr, data & 0xFFFFFFFF); return
+            if(numBytes == 1): DMem[adr] = data & 0xFF; return
+            if(numBytes == 2): U16.pack_into(DMem, adr, data & 0xFFFF); return
+        for i in range(numBytes):  # Access wraps around the end of memory
+            DMem[(adr+i)%memSize] = data & 0xFF
+            data = data>>8
+    
+    def loadData(self, adr, data):
+        # Copies a bytes-like object (bytes, bytearray, memoryview, mmap...) into DMem starting at adr
+        data = memoryview(data).cast("B")
+        if( adr < 0 or adr+len(data) > len(self.DMem) ):
+            raise ValueError(f"Data image of {len(data)} bytes doesn't fit to DataMemory at {adr}")
+        if(self.dmemShared):
+            self._unshareDMem()
+        memoryview(self.DMem)[adr:adr+len(data)] = data
+    
+    def dumpData(self, adr=0, length=None):
+        # Returns a read-only memoryview of DMem[adr:adr+length], without copying
+        if(length is None):
+            length = len(self.DMem) - adr
+        if( adr < 0 or length < 0 or adr+length > len(self.DMem) ):
+            raise ValueError(f"Region [{adr}:{adr+length}] is outside of DataMemory")
+        return memoryview(self.DMem)[adr:adr+length].toreadonly()
+    
+    def writeToRF(self, reg, data):
+        if(reg == self.zeroRegister):
+            return
+        data=unsigned(data)
+        self.RF[reg]=data
+        if(self.trace == TraceLevels.TEXT):
+            print(f"{self.registerNames[reg]} <= 0x{data:08X} = {data}  ", end='')
+            if( data & 0x80000000 ): #Number may be signed
+                print(f" = {data-(1<<32)} ", end='')
+        elif(self.trace == TraceLevels.EVENTS):
+            self.traceEvents.append( ("rf", reg, data) )
+    
+    def tracePC(self, next_PC):
+        if(self.trace == TraceLevels.TEXT):
+            print(f"PC <= 0x{next_PC:08X}", end='')
+        elif(self.trace == TraceLevels.EVENTS):
+            self.traceEvents.append( ("pc", next_PC) )
+
+
+
+class Snapshot:
+    # Architectural state of a Computer at one point, restored with Computer.restore()
+    # Memories are not copied, the Computer copies them before its next write
+    def __init__(self, computer):
+        self.PC = computer.PC
+        self.RF = tuple(computer.RF)
+        self.extra = computer._savedExtra()
+        self.DMem = computer.DMem
+        self.IMem = computer.IMem
+        self.decodeCache = computer.decodeCache
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+# Helpers shared by every architecture, riscv.helper_utils and arm.helper_utils re-export them
+
+import re
+import sys
+from array import array
+
+# Same literals int(x, 0) accepts, so checkInt can call int() without a try
+IntegerPattern = re.compile(r"\s*[+-]?(0[xX](_?[0-9a-fA-F])+|0[oO](_?[0-7])+|0[bB](_?[01])+|[1-9](_?[0-9])*|0(_?0)*)\s*")
+
+# Instruction word lines of the disassembler, after "_" and " " are removed
+HexWordPattern = re.compile(r"[0-9a-fA-F]{8}")
+HexLineChars = set("0123456789abcdefABCDEF_ \t\r\n")
+
+# Labels, "name:" at the start of a line, and the operands that can refer to them
+LabelPattern = re.compile(r"\s*([A-Za-z_.$][A-Za-z0-9_.$]*)\s*:")
+SymbolPattern = re.compile(r"\s*([A-Za-z_.$][A-Za-z0-9_.$]*)\s*(?:([+-])(.+))?")
+
+def makeRegisterParsers(registerMap):
+    # (parseReg, checkReg) for a "name": number map with lowercase names
+    # Names written exactly as in the map or in uppercase are found with one dict lookup
+    lookup = {**{name.upper(): number for name,number in registerMap.items()}, **registerMap}
+    def checkReg(regString):
+        # Register number, None for unknown names
+        number = lookup.get(regString)
+        if(number is None):
+            number = registerMap.get(regString.lower().strip())
+        return number
+    def parseReg(regString):
+        number = checkReg(regString)
+        if(number is None):
+            raise KeyError(regString.lower().strip())
+        return number
+    return parseReg, checkReg
+
+def checkInt(text):
+    # int(text, 0), None if text isn't an integer literal
+    digits = text.strip()
+    if( digits.isdecimal() and (digits[0] != "0" or len(digits) == 1) ):  # Plain decimal, the common case
+        return int(digits)
+    if( IntegerPattern.fullmatch(text) is None ):
+        return None
+    return int(text, 0)
+
+class SymbolTable:
+    # Label name -> address in its section, filled by the first assembler pass
+    # lookups counts resolve() calls, so a caller can tell whether a line depended on symbols, and misses
+    # the ones of names that weren't defined (yet)
+    def __init__(self):
+        self.addresses = {}
+        self.sections = {}
+        self.lookups = 0
+        self.misses = 0
+    
+    def define(self, name, section, address):
+        # False if name is already defined
+        if(name in self.addresses):
+            return False
+        self.addresses[name] = address
+        self.sections[name] = section
+        return True
+    
+    def resolve(self, name):
+        # Address of name, None if it isn't defined
+        self.lookups += 1
+        address = self.addresses.get(name)
+        if(address is None):
+            self.misses += 1
+        return address
+    
+    def evaluate(self, text):
+        # (value, None) or (None, error message) for "label", "label+offset", "label-offset" or an integer
+        value = checkInt(text)
+        if(value is not None):
+            return value, None
+        match = SymbolPattern.fullmatch(text)
+        if(match is None):
+            return None, f"Invalid expression '{text.strip()}'"
+        name, sign, offset = match.groups()
+        value = self.resolve(name)
+        if(value is None):
+            return None, f"Unknown symbol '{name}'"
+        if(sign is not None):
+            offset = checkInt(offset)
+            if(offset is None):
+                return None, f"Invalid expression '{text.strip()}'"
+            value = value+offset if sign == "+" else value-offset
+        return value, None
+    
+    def __contains__(self, name):
+        return name in self.addresses
+    
+    def __len__(self):
+        return len(self.addresses)
+
+def num2str(num):
+    if(num<1000 and num>-1000):
+        return str(num)
+    else:
+        if(num<0):
+            return f"-0x{-num:X}"
+        else:
+            return f"0x{num:X}"
+    
+# Masks[n] has the low n bits set, SignBits[n] is bit n-1 and Spans[n] is 2**n, for every width up to 64
+Masks = [(1<<n)-1 for n in range(65)]
+SignBits = [(1<<n)>>1 for n in range(65)]
+Spans = [1<<n for n in range(65)]
+
+def signed(value, bitlen=32):
+    if( value >= SignBits[bitlen] ):  # Same as (value>>(bitlen-1)) > 0
+        value -= Spans[bitlen]
+    return value
+
+def unsigned(value, bitlen=32):
+    return value & Masks[bitlen]
+
+def getBits(num, high, low):
+    return (num>>low) & Masks[high-low+1]
+
+"""
+Field layouts, the input of the generated extractors and encoders
+    [(name, [(high, low, position), ...], signBits), ...]
+Bits [high:low] of the word go to bit position of the field, a field can be split to several pieces
+(a RISC-V B-type immediate has four). signBits is the width of a signed field, 0 for unsigned ones
+"""
+
+def _fieldExpression(pieces, signBits, word="h"):
+    # Python expression for one field of the word, shifts and masks are folded to constants
+    terms = []
+    for high,low,position in pieces:
+        mask = Masks[high-low+1] << position
+        if(low > position):   terms.append(f"(({word} >> {low-position}) & {mask:#x})")
+        elif(low < position): terms.append(f"(({word} << {position-low}) & {mask:#x})")
+        else:                 terms.append(f"({word} & {mask:#x})")
+    expression = " | ".join(terms)
+    if(signBits):
+        expression = f"((({expression}) ^ {SignBits[signBits]:#x}) - {SignBits[signBits]:#x})"
+    return expression
+
+def _compileFunction(source, name):
+    namespace = {}
+    exec(source, namespace)
+    function = namespace[name]
+    function.source = source  # Kept for debugging
+    return function
+
+def makeFieldExtractor(layout):
+    # fn(word) -> tuple of the fields in layout order, one generated expression per field
+    fields = ", ".join(_fieldExpression(pieces, signBits) for name,pieces,signBits in layout)
+    return _compileFunction(f"def extract(h):\n    return ({fields},)\n", "extract")
+
+def makeFieldParser(layout, leading=("mnem",)):
+    # fn(word, *leading) -> {leading..., field: value...}, the parsed dict of an instruction
+    items = [f"{key!r}: {key}" for key in leading] + [f"{name!r}: {_fieldExpression(pieces, signBits)}" for name,pieces,signBits in layout]
+    return _compileFunction(f"def parse(h, {', '.join(leading)}):\n    return {{{', '.join(items)}}}\n", "parse")
+
+def makeFieldEncoder(layout, fixed=0):
+    # fn(parsed) -> fixed | word bits of the layout fields, inverse of makeFieldParser. Negative values are masked
+    reads = "".join(f"    {name} = parsed[{name!r}]\n" for name,pieces,signBits in layout)
+    terms = []
+    for name,pieces,signBits in layout:
+        for high,low,position in pieces:   # The same folding as _fieldExpression, in the other direction
+            mask = Masks[high-low+1] << low
+            if(position > low):   terms.append(f"(({name} >> {position-low}) & {mask:#x})")
+            elif(position < low): terms.append(f"(({name} << {low-position}) & {mask:#x})")
+            else:                 terms.append(f"({name} & {mask:#x})")
+    return _compileFunction(f"def encode(parsed):\n{reads}    return {' | '.join([f'{fixed:#x}'] + terms)}\n", "encode")
+
+def num2Hex(num):
+    hex_str=f"{num:08x}"
+    #hex_str = hex_str[::-1]
+    hex_str = hex_str[0:4] + "_" + hex_str[4:8]
+    return "0x"+hex_str
+
+def wordBytes(buf):
+    # Byte memoryview of a bytes-like object (bytes, bytearray, memoryview, mmap...), without copying
+    # Raises ValueError if it isn't a whole number of 32-bit words
+    view = memoryview(buf).cast("B")
+    if( len(view) % 4 != 0 ):
+        raise ValueError(f"Binary image length ({len(view)} bytes) is not a multiple of 4")
+    return view
+
+def bytes2Words(buf):
+    # Little-endian 32-bit words of a bytes-like object as array("I")
+    view = wordBytes(buf)
+    words = array("I")
+    words.frombytes(view)
+    if(sys.byteorder == "big"):
+        words.byteswap()
+    return words
+
+def words2Bytes(words):
+    # Inverse of bytes2Words
+    words = array("I", words)
+    if(sys.byteorder == "big"):
+        words.byteswap()
+    return words.tobytes()
@@ -1,2 +1,3 @@
 from . import helper_utils
-from . import computer
\ No newline at end of file
+from . import computer
+from . import batch
\ No newline at end of file
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from riscv.helper_utils import *
+from riscv.computer import Computer, Engines, TraceLevels
+
+DEFAULT_MAX_INSTRUCTIONS = 10_000_000
+DEFAULT_TIMEOUT = 10.0  # Seconds per job
+
+"""
+Job (dict, every key except "program" is optional):
+    "program":          assembly text, hex text if "format" is "hex", a bytes-like image if "format" is "bin"
+    "format":           "assembly" | "hex" | "bin"
+    "registers":        {"a0": 5, "x11": 0x10, ...} initial register values
+    "data":             bytes-like image loaded to DataMemory at "dataAddress" (default 0)
+    "maxInstructions":  instruction budget, overrides the run_batch default
+    "timeout":          seconds, overrides the run_batch default
+
+Result (dict):
+    "status":           "halt" | "budget" | "deadline" | "cycle" (see StopReasons) | "error"
+    "error":            message when status is "error"
+    "instructions":     number of executed instructions
+    "PC", "registers":  final architectural state
+    "rfDigest", "dmemDigest": sha256 of the final register file (32 little-endian words) and DataMemory
+    "seconds":          wall time spent in the job
+"""
+
+def run_job(job, maxInstructions=DEFAULT_MAX_INSTRUCTIONS, timeout=DEFAULT_TIMEOUT):
+    maxInstructions = job.get("maxInstructions", maxInstructions)
+    timeout = job.get("timeout", timeout)
+    start = time.monotonic()
+    result = {"status": "error", "error": None, "instructions": 0}
+    try:
+        comp = Computer(engine=Engines.COMPILED, trace=TraceLevels.NONE)
+        if( job.get("format", "assembly") == "hex" ):
+            comp.load_program_from_hex(job["program"])
+        elif( job.get("format", "assembly") == "bin" ):
+            comp.load_program_from_bytes(job["program"])
+        else:
+            comp.compile_from_assembly(job["program"])
+        for reg,value in job.get("registers", {}).items():
+            if(isinstance(reg, str)):
+                reg = parseReg(reg)
+            comp.writeToRF(reg, value)
+        if( job.get("data") is not None ):
+            comp.loadData(job.get("dataAddress", 0), job["data"])
+
+        deadline = None if timeout is None else start+timeout
+        runResult = comp.run(maxInstructions, deadline)
+        result["status"] = runResult.reason
+        result["instructions"] = runResult.instructions
+        result["PC"] = comp.PC
+        result["registers"] = list(comp.RF)
+        result["rfDigest"] = hashlib.sha256(struct.pack("<32I", *comp.RF)).hexdigest()
+        result["dmemDigest"] = hashlib.sha256(comp.DMem).hexdigest()
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.monotonic()-start
+    return result
+
+def _run_job_with_defaults(args):
+    job, maxInstructions, timeout = args
+    return run_job(job, maxInstructions, timeout)
+
+def run_batch(jobs, maxWorkers=None, maxInstructions=DEFAULT_MAX_INSTRUCTIONS, timeout=DEFAULT_TIMEOUT, chunksize=1):
+    # Runs every job in a process pool, results are returned in job order
+    # Budgets and deadlines are enforced inside the workers, so a runaway program only holds its own worker
+    args = [(job, maxInstructions, timeout) for job in jobs]
+    if( maxWorkers == 1 or len(args) <= 1 ):
+        return [_run_job_with_defaults(a) for a in args]
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        return list(executor.map(_run_job_with_defaults, args, chunksize=chunksize))
+
+
+if __name__ == "__main__":
+    # python3 -m riscv.batch prog1.s prog2.s ...   (one JSON result per line)
+    jobs = []
+    for path in sys.argv[1:]:
+        with open(path,"r") as f:
+            jobs.append({"program": f.read()})
+    for path,result in zip(sys.argv[1:], run_batch(jobs)):
+        print(json.dumps({"file": path, **result}))
@@ -1,87 +1,174 @@
 #!/usr/bin/env python3
 
 from riscv.helper_utils import *
+from isa.assembler import *
+from isa.computer import *
 
 XORED_STUDENT_IDS = 123 ^ 456
 
-class Computer:
-    def __init__(self):
-        self.PC = 0x00000000  # Program Counter
-        self.RF = [0] * 32  # Register File (Registers are always stored unsigned)
-        self.DMem = [0] * (2**16)  # Data Memory        (each element is 8-bits)
-        self.IMem = [0] * (2**14)  # Instruction Memory (each element is 32-bits)
-        
-    def load_program_from_hex(self, program_hex):
-        lines = [line.strip() for line in program_hex.split("\n") if line.strip() != ""]
-        im_ptr = 0 #Instruction Memory Pointer
-        for line in lines:
-            line = line.replace(" ","")
-            line = line[6:8]+line[4:6]+line[2:4]+line[0:2] # Reverse byte order
-            inst_hex = int(line,16)
-            self.IMem[im_ptr//4] = inst_hex
-            im_ptr += 4
+MAX_BLOCK_LENGTH = 64  # Instructions, a longer straight-line run is split into chained blocks
+
+# Python expression for the value an instruction writes to rd, used to generate basic block functions
+BlockTemplates = {
+    "ADD":   "(RF[{rs1}] + RF[{rs2}]) & 0xFFFFFFFF",
+    "SUB":   "(RF[{rs1}] - RF[{rs2}]) & 0xFFFFFFFF",
+    "AND":   "RF[{rs1}] & RF[{rs2}]",
+    "OR":    "RF[{rs1}] | RF[{rs2}]",
+    "XOR":   "RF[{rs1}] ^ RF[{rs2}]",
+    "SLT":   "int((RF[{rs1}]^0x80000000) < (RF[{rs2}]^0x80000000))",
+    "SLTU":  "int(RF[{rs1}] < RF[{rs2}])",
+    "SLL":   "(RF[{rs1}] << (RF[{rs2}] & 0x1F)) & 0xFFFFFFFF",
+    "SRL":   "RF[{rs1}] >> (RF[{rs2}] & 0x1F)",
+    "SRA":   "(((RF[{rs1}]^0x80000000)-0x80000000) >> (RF[{rs2}] & 0x1F)) & 0xFFFFFFFF",
     
-    def compile_from_assembly(self, program_assembly):
-        program_hex = riscv_assemble(program_assembly)
-        self.load_program_from_hex(program_hex)
-        
-    def run(self):
-        self.PC=0
-        instruction = RiscvInstruction()
-        while(True):
-            inst_hex = self.IMem[self.PC//4]
-            if(inst_hex==0x00000000): break
-            instruction.fromHex(inst_hex)
-            print(f"_{self.PC:02X}: ", end='')
-            print(f"{instruction.s:30}", end='')
-            instruction.run(self)
-            print()
+    "ADDI":  "(RF[{rs1}] + {imm}) & 0xFFFFFFFF",
+    "ANDI":  "RF[{rs1}] & {uimm}",
+    "ORI":   "RF[{rs1}] | {uimm}",
+    "XORI":  "RF[{rs1}] ^ {uimm}",
+    "SLTI":  "int(((RF[{rs1}]^0x80000000)-0x80000000) < {imm})",
+    "SLTIU": "int(RF[{rs1}] < {uimm})",
+    "SLLI":  "(RF[{rs1}] << {shamt}) & 0xFFFFFFFF",
+    "SRLI":  "RF[{rs1}] >> {shamt}",
+    "SRAI":  "(((RF[{rs1}]^0x80000000)-0x80000000) >> {shamt}) & 0xFFFFFFFF",
+    "XORID": "RF[{rs1}] ^ {xorid}",
     
-    def readData(self, adr, numBytes=4):
-        memSize = len(self.DMem)
-        readval=0
-        for i in range(numBytes):
-            readval |= self.DMem[(adr+i)%memSize]<<(8*i)
-        return readval
+    "LW":    "readData(RF[{rs1}] + {imm}, 4)",
+    "LHU":   "readData(RF[{rs1}] + {imm}, 2)",
+    "LBU":   "readData(RF[{rs1}] + {imm}, 1)",
+    "LH":    "((readData(RF[{rs1}] + {imm}, 2)^0x8000)-0x8000) & 0xFFFFFFFF",
+    "LB":    "((readData(RF[{rs1}] + {imm}, 1)^0x80)-0x80) & 0xFFFFFFFF",
     
-    def writeData(self, adr, data, numBytes=4):
-        data_str = f"{data:08X}"
-        print(f"DataMemory[{adr+numBytes-1}:{adr}] <= 0x{data_str[-2*numBytes:]}", end='')
-        memSize = len(self.DMem)
-        for i in range(numBytes):
-            self.DMem[(adr+i)%memSize] = data & 0xFF
-            data = data>>8
-
-    def writeToRF(self, reg, data):
-        if(reg==0):
-            return
-        data=unsigned(data)
-        self.RF[reg]=data
-        print(f"x{reg} <= 0x{data:08X} = {data}  ", end='')
-        if( data & 0x80000000 ): #Number may be signed
-            print(f" = {data-(1<<32)} ", end='')
-
-
-
-class RiscvInstruction:
-    def __init__(self):
-        self.h = 0x00000000       #Readonly value
-        self.s = "NOP;"           #Readonly value
-        self.parsed = ["NOP"]     #Readonly value
+    "LUI":   "{luiValue}",
+    "AUIPC": "{auipcValue}",
+}
+
+# Branch conditions for generated basic blocks
+BlockConditions = {
+    "BEQ":  "RF[{rs1}] == RF[{rs2}]",
+    "BNE":  "RF[{rs1}] != RF[{rs2}]",
+    "BLT":  "(RF[{rs1}]^0x80000000) < (RF[{rs2}]^0x80000000)",
+    "BGE":  "(RF[{rs1}]^0x80000000) >= (RF[{rs2}]^0x80000000)",
+    "BLTU": "RF[{rs1}] < RF[{rs2}]",
+    "BGEU": "RF[{rs1}] >= RF[{rs2}]",
+}
+
+MASK32 = 0xFFFFFFFF
+SIGN32 = 0x80000000  # (a^SIGN32) < (b^SIGN32) compares two unsigned registers as signed
+
+class Engines:
+    INTERPRETER = "interpreter"  # Decodes and dispatches on mnemonic at every step (RiscvInstruction.run)
+    COMPILED =    "compiled"     # Runs closures with operands already bound (RiscvInstruction.compile)
+    BLOCK =       "block"        # Runs one generated function per basic block (RiscvInstruction.blockSource)
+                                 # COMPILED and BLOCK are only used with TraceLevels.NONE, traced runs always go through the interpreter
+
+class Computer(BaseComputer):
+    registerNames = [f"x{reg}" for reg in range(32)]
+    zeroRegister = 0
     
-    def fromHex(self, h):
-        self.parsed = RiscvInstruction._parseFromHex(h)
-        self.s = RiscvInstruction._generateStr(self.parsed)
-        self.h = h
+    def __init__(self, engine=Engines.INTERPRETER, trace=TraceLevels.TEXT, dmemSize=2**16, imemSize=2**14):
+        BaseComputer.__init__(self, engine, trace, 32, dmemSize, imemSize)
     
-    def fromStr(self, s):
-        self.parsed = RiscvInstruction._parseFromStr(s)
-        self.h = RiscvInstruction._generateHex(self.parsed)
-        self.s = s
+    def _resetEngineCaches(self):
+        self.compiledCache = [None] * len(self.IMem)  # Compiled closure per IMem slot (Engines.COMPILED)
+        self.blockCache = {}  # Start PC -> (function, instruction count, first slot, end slot) (Engines.BLOCK)
     
+    def _instructionWritten(self, slot):
+        self.compiledCache[slot] = None
+        for startPC,block in list(self.blockCache.items()):
+            if( block[2] <= slot < block[3] ):
+                del self.blockCache[startPC]
+        
+    def _chunkRunner(self):
+        # COMPILED and BLOCK are only used without tracing
+        if(self.engine == Engines.COMPILED and not self.trace):
+            return self._runCompiled
+        if(self.engine == Engines.BLOCK and not self.trace):
+            return self._runBlocks
+        return self._runInterpreted
+    
+    def _runCompiled(self, limit):
+        # Same architectural behaviour as _runInterpreted, but without tracing
+        compiledCache = self.compiledCache
+        pc = self.PC
+        try:
+            for executed in range(limit):
+                fn = compiledCache[pc//4]
+                if(fn is None):
+                    inst_hex = self.IMem[pc//4]
+                    if(inst_hex==0x00000000): return executed, True
+                    instruction = self.decodeCache[pc//4]
+                    if(instruction is None):
+                        instruction = RiscvInstruction()
+                        instruction.fromHex(inst_hex)
+                        self.decodeCache[pc//4] = instruction
+                    fn = instruction.compile(self)
+                    compiledCache[pc//4] = fn
+                pc = fn(pc)
+            return limit, False
+        finally:
+            self.PC = pc
+    
+    def _runBlocks(self, limit):
+        # Executes whole basic blocks, the tail of the chunk and anything a block can't hold
+        # (halt, illegal words, PC outside of IMem) go through _runCompiled
+        blockCache = self.blockCache
+        pc = self.PC
+        executed = 0
+        while(executed < limit):
+            block = blockCache.get(pc)
+            if(block is None):
+                block = self._buildBlock(pc)
+                if(block is None): break
+                blockCache[pc] = block
+            if(block[1] > limit-executed): break
+            pc = block[0]()
+            executed += block[1]
+        self.PC = pc
+        if(executed == limit):
+            return executed, False
+        count, halted = self._runCompiled(limit-executed)
+        return executed+count, halted
+    
+    def _buildBlock(self, startPC):
+        # Generates one function for the straight-line run starting at startPC, up to and including
+        # the first branch/JAL/JALR. Returns None if not even the first instruction can be put in a block
+        lines = []
+        pc = startPC
+        count = 0
+        while(count < MAX_BLOCK_LENGTH):
+            slot = pc//4
+            if( slot < 0 or slot >= len(self.IMem) ): break
+            inst_hex = self.IMem[slot]
+            if(inst_hex == 0x00000000): break
+            instruction = self.decodeCache[slot]
+            if(instruction is None):
+                instruction = RiscvInstruction()
+                try:
+                    instruction.fromHex(inst_hex)
+                except ValueError:
+                    break
+                self.decodeCache[slot] = instruction
+            if(instruction.parsed["mnem"] == "HALT"): break
+            source, endsBlock = instruction.blockSource(pc)
+            lines += source
+            count += 1
+            pc += 4
+            if(endsBlock): break
+        else:
+            endsBlock = False
+        if(count == 0):
+            return None
+        if(not endsBlock):
+            lines.append(f"return {pc}")
+        namespace = {"RF": self.RF, "readData": self.readData, "storeData": self.storeData}
+        exec("def block():\n" + "\n".join("    "+line for line in lines), namespace)
+        return (namespace["block"], count, startPC//4, startPC//4+count)
+    
+
+
+class RiscvInstruction(BaseInstruction):
     def run(self, computer):
         RF = computer.RF
-        DM = computer.DMem
         mnem = self.parsed["mnem"]
         info = InstructionDatabase[mnem]
         type = info[0]
@@ -107,7 +194,8 @@ class RiscvInstruction:
                 elif(mnem=="BGEU"): condition=(opr1>=opr2)
                 next_PC = computer.PC + self.parsed["imm"]
             if(condition):
-                print(f"PC <= 0x{next_PC:08X}", end='')
+                if(computer.trace):
+                    computer.tracePC(next_PC)
                 computer.PC = next_PC
             else:
                 computer.PC += 4
@@ -154,153 +242,365 @@ class RiscvInstruction:
             computer.PC += 4
     
     
+    def compile(self, computer):
+        # Returns a function fn(PC) -> next_PC that executes this instruction on computer
+        # Operands are bound here, so nothing is looked up by name when fn runs
+        RF = computer.RF
+        mnem = self.parsed["mnem"]
+        type = InstructionDatabase[mnem][0]
+        rd = self.parsed.get("rd", 0)
+        rs1 = self.parsed.get("rs1", 0)
+        rs2 = self.parsed.get("rs2", 0)
+        imm = self.parsed.get("imm", 0)
+        
+        if( mnem == "HALT" ): # Only the all-zero word halts, the interpreter can't execute other HALT encodings either
+            raise ValueError(f"Can't execute HALT encoding 0x{self.h:08X}")
+        
+        if( type == "B" ):
+            if(mnem=="BEQ"):
+                def fn(pc):
+                    return pc+imm if RF[rs1]==RF[rs2] else pc+4
+            elif(mnem=="BNE"):
+                def fn(pc):
+                    return pc+imm if RF[rs1]!=RF[rs2] else pc+4
+            elif(mnem=="BLT"):
+                def fn(pc):
+                    return pc+imm if (RF[rs1]^SIGN32)<(RF[rs2]^SIGN32) else pc+4
+            elif(mnem=="BGE"):
+                def fn(pc):
+                    return pc+imm if (RF[rs1]^SIGN32)>=(RF[rs2]^SIGN32) else pc+4
+            elif(mnem=="BLTU"):
+                def fn(pc):
+                    return pc+imm if RF[rs1]<RF[rs2] else pc+4
+            elif(mnem=="BGEU"):
+                def fn(pc):
+                    return pc+imm if RF[rs1]>=RF[rs2] else pc+4
+            return fn
+        
+        if( mnem == "JAL" ):
+            if(rd==0):
+                def fn(pc):
+                    return pc+imm
+            else:
+                def fn(pc):
+                    RF[rd] = (pc+4) & MASK32
+                    return pc+imm
+            return fn
+        
+        if( mnem == "JALR" ): # rs1 is read after rd is written, same as the interpreter
+            if(rd==0):
+                def fn(pc):
+                    return RF[rs1]+imm
+            else:
+                def fn(pc):
+                    RF[rd] = (pc+4) & MASK32
+                    return RF[rs1]+imm
+            return fn
+        
+        if( type == "S" ):
+            storeData = computer.storeData
+            numBytes = {"SB":1, "SH":2, "SW":4}[mnem]
+            def fn(pc):
+                storeData(RF[rs1]+imm, RF[rs2], numBytes)
+                return pc+4
+            return fn
+        
+        if( rd == 0 ): # Remaining instructions only write rd, and loads have no side effects
+            def fn(pc):
+                return pc+4
+            return fn
+        
+        if( type == "R" ):
+            if(mnem=="ADD"):
+                def fn(pc):
+                    RF[rd] = (RF[rs1]+RF[rs2]) & MASK32
+                    return pc+4
+            elif(mnem=="SUB"):
+                def fn(pc):
+                    RF[rd] = (RF[rs1]-RF[rs2]) & MASK32
+                    return pc+4
+            elif(mnem=="AND"):
+                def fn(pc):
+                    RF[rd] = RF[rs1] & RF[rs2]
+                    return pc+4
+            elif(mnem=="OR"):
+                def fn(pc):
+                    RF[rd] = RF[rs1] | RF[rs2]
+                    return pc+4
+            elif(mnem=="XOR"):
+                def fn(pc):
+                    RF[rd] = RF[rs1] ^ RF[rs2]
+                    return pc+4
+            elif(mnem=="SLT"):
+                def fn(pc):
+                    RF[rd] = int((RF[rs1]^SIGN32) < (RF[rs2]^SIGN32))
+                    return pc+4
+            elif(mnem=="SLTU"):
+                def fn(pc):
+                    RF[rd] = int(RF[rs1] < RF[rs2])
+                    return pc+4
+            elif(mnem=="SLL"):
+                def fn(pc):
+                    RF[rd] = (RF[rs1] << (RF[rs2] & 0x1F)) & MASK32
+                    return pc+4
+            elif(mnem=="SRL"):
+                def fn(pc):
+                    RF[rd] = RF[rs1] >> (RF[rs2] & 0x1F)
+                    return pc+4
+            elif(mnem=="SRA"):
+                def fn(pc):
+                    RF[rd] = (((RF[rs1]^SIGN32)-SIGN32) >> (RF[rs2] & 0x1F)) & MASK32
+                    return pc+4
+            return fn
+        
+        if( type == "U" ):
+            if(mnem=="LUI"):
+                value = imm & MASK32
+                def fn(pc):
+                    RF[rd] = value
+                    return pc+4
+            elif(mnem=="AUIPC"):
+                def fn(pc):
+                    RF[rd] = (pc+imm) & MASK32
+                    return pc+4
+            return fn
+        
+        # "I" and "I2"
+        uimm = unsigned(imm)
+        if(mnem=="ADDI"):
+            def fn(pc):
+                RF[rd] = (RF[rs1]+imm) & MASK32
+                return pc+4
+        elif(mnem=="ANDI"):
+            def fn(pc):
+                RF[rd] = RF[rs1] & uimm
+                return pc+4
+        elif(mnem=="ORI"):
+            def fn(pc):
+                RF[rd] = RF[rs1] | uimm
+                return pc+4
+        elif(mnem=="XORI"):
+            def fn(pc):
+                RF[rd] = RF[rs1] ^ uimm
+                return pc+4
+        elif(mnem=="SLTI"):
+            def fn(pc):
+                RF[rd] = int(((RF[rs1]^SIGN32)-SIGN32) < imm)
+                return pc+4
+        elif(mnem=="SLTIU"):
+            def fn(pc):
+                RF[rd] = int(RF[rs1] < uimm)
+                return pc+4
+        elif(mnem=="SLLI"):
+            shamt = uimm & 0x1F
+            def fn(pc):
+                RF[rd] = (RF[rs1] << shamt) & MASK32
+                return pc+4
+        elif(mnem=="SRLI"):
+            shamt = uimm & 0x1F
+            def fn(pc):
+                RF[rd] = RF[rs1] >> shamt
+                return pc+4
+        elif(mnem=="SRAI"):
+            shamt = uimm & 0x1F
+            def fn(pc):
+                RF[rd] = (((RF[rs1]^SIGN32)-SIGN32) >> shamt) & MASK32
+                return pc+4
+        elif(mnem=="XORID"):
+            def fn(pc):
+                RF[rd] = RF[rs1] ^ XORED_STUDENT_IDS
+                return pc+4
+        elif(mnem in ["LB","LH","LW","LBU","LHU"]):
+            readData = computer.readData
+            if(mnem=="LW"):
+                def fn(pc):
+                    RF[rd] = readData(RF[rs1]+imm, 4)
+                    return pc+4
+            elif(mnem=="LHU"):
+                def fn(pc):
+                    RF[rd] = readData(RF[rs1]+imm, 2)
+                    return pc+4
+            elif(mnem=="LBU"):
+                def fn(pc):
+                    RF[rd] = readData(RF[rs1]+imm, 1)
+                    return pc+4
+            elif(mnem=="LH"):
+                def fn(pc):
+                    RF[rd] = ((readData(RF[rs1]+imm, 2)^0x8000)-0x8000) & MASK32
+                    return pc+4
+            elif(mnem=="LB"):
+                def fn(pc):
+                    RF[rd] = ((readData(RF[rs1]+imm, 1)^0x80)-0x80) & MASK32
+                    return pc+4
+        return fn
+    
+    
+    def blockSource(self, pc):
+        # Python statements executing this instruction at address pc inside a generated basic block
+        # Returns (lines, endsBlock), a block ending instruction returns the next PC
+        mnem = self.parsed["mnem"]
+        type = InstructionDatabase[mnem][0]
+        rd = self.parsed.get("rd", 0)
+        rs1 = self.parsed.get("rs1", 0)
+        rs2 = self.parsed.get("rs2", 0)
+        imm = self.parsed.get("imm", 0)
+        if( type == "B" ):
+            condition = BlockConditions[mnem].format(rs1=rs1, rs2=rs2)
+            return [f"return {pc+imm} if {condition} else {pc+4}"], True
+        if( mnem in ["JAL","JALR"] ):
+            lines = [f"RF[{rd}] = {(pc+4) & MASK32}"] if rd!=0 else []
+            if(mnem == "JAL"):
+                lines.append(f"return {pc+imm}")
+            else: # rs1 is read after rd is written, same as the interpreter
+                lines.append(f"return RF[{rs1}] + {imm}")
+            return lines, True
+        if( type == "S" ):
+            numBytes = {"SB":1, "SH":2, "SW":4}[mnem]
+            return [f"storeData(RF[{rs1}] + {imm}, RF[{rs2}], {numBytes})"], False
+        if( rd == 0 ):
+            return [], False
+        uimm = unsigned(imm)
+        value = BlockTemplates[mnem].format(rs1=rs1, rs2=rs2, imm=imm, uimm=uimm, shamt=uimm & 0x1F,
+            xorid=XORED_STUDENT_IDS, luiValue=imm & MASK32, auipcValue=(pc+imm) & MASK32)
+        return [f"RF[{rd}] = {value}"], False
+    
+    
     # Static functions
     def _parseFromHex(h):
-        parsed={}
-        opcode = getBits(h,6,0)
-        funct3 = getBits(h,14,12)
-        funct7 = getBits(h,31,25)
-        rd = getBits(h,11,7)
-        rs1 = getBits(h,19,15)
-        rs2 = getBits(h,24,20)
-        possibleInstructions = {key:value for key,value in InstructionDatabase.items() if value[1]==opcode}
-        matches=[]
-        for mnem,value in possibleInstructions.items():
-            type = value[0]
-            if(type in ["R","I2"]):
-                if(value[2]==funct3 and value[3]==funct7):
-                    matches.append(mnem)
-            elif(type in ["I","S","B"]):
-                if(value[2]==funct3):
-                    matches.append(mnem)
-            elif(type in ["U","J"]):
-                matches.append(mnem)
-        if(len(matches) != 1):
+        decoder = Decoders.get(decodeKey(h))
+        if(decoder is None):
+            opcode, funct3, funct7 = decodeKey(h)
+            matches = DecodeTable.get( (opcode,funct3,funct7), [] )
             raise ValueError(f"Instruction had not 1 match! ({len(matches)} matches)  opcode={opcode} funct3={funct3} funct7={funct7}")
-        mnem = matches[0]
-        type = possibleInstructions[mnem][0]
-        if(type == "R"):
-            parsed = {"mnem": mnem, "rd":rd, "rs1":rs1, "rs2":rs2}
-        elif(type == "I"):
-            imm = getBits(h,31,20)
-            parsed = {"mnem": mnem, "rd":rd, "rs1":rs1, "imm":signed(imm,12)}
-        elif(type == "I2"):
-            imm = getBits(h,24,20)
-            parsed = {"mnem": mnem, "rd":rd, "rs1":rs1, "imm":imm}
-        elif(type == "S"):
-            imm = (getBits(h,31,25)<<5) | \
-                   getBits(h,11,7)
-            parsed = {"mnem": mnem, "rs1":rs1, "rs2":rs2, "imm":signed(imm,12)}
-        elif(type == "B"):
-            imm = (getBits(h,31,31)<<12) | \
-                   (getBits(h,30,25)<<5) | \
-                   (getBits(h,11,8)<<1) | \
-                   (getBits(h,7,7)<<11)
-            parsed = {"mnem": mnem, "rs1":rs1, "rs2":rs2, "imm":signed(imm,13)}
-        elif(type == "U"):
-            imm = getBits(h,31,12)<<12
-            parsed = {"mnem": mnem, "rd":rd, "imm":imm}
-        elif(type == "J"):
-            imm = (getBits(h,31,31)<<20) | \
-                   (getBits(h,30,21)<<1) | \
-                   (getBits(h,20,20)<<11) | \
-                   (getBits(h,19,12)<<12)
-            parsed = {"mnem": mnem, "rd":rd, "imm":signed(imm,21)}
-        return parsed
+        mnem, parse = decoder
+        return parse(h, mnem)
     
-    def _parseFromStr(s):
-        s = s.split(";")[0] #Ignore comments after ;
-        s = s.split("#")[0] #Ignore comments after #
-        s = s.split("//")[0] #Ignore comments after //
-        s = s.strip()
-        parts = s.split(" ")
-        mnemonic = parts[0].upper()
-        args = " ".join(parts[1:])
-        parsed = []
-        if( mnemonic not in InstructionDatabase ):
-            return;
-        instructionInfo = InstructionDatabase[mnemonic]
-        instructionType = instructionInfo[0]
-        if(instructionType == "R"):
-            rd, rs1, rs2 = args.split(",")
-            parsed = {"mnem": mnemonic,  "rd": parseReg(rd), "rs1": parseReg(rs1), "rs2": parseReg(rs2)}
-        elif(instructionType in ["I","I2"] ):
-            if( mnemonic in ["LB","LH","LW","LBU","LHU","JALR"]): # mnem rd,offset(rs1)
-                rd, imm_rs1 = args.split(",")
-                imm,rs1 = imm_rs1.split("(")
-                rs1 = rs1.replace(")", "")
-            else:
-                rd, rs1, imm = args.split(",")
-            if(instructionType == "I"):
-                imm = parseImm(imm,12,0);
-            else: # "I2"
-                imm = parseImm(imm,5,0,False); # shamt
-            parsed = {"mnem": mnemonic, "rd": parseReg(rd), "rs1": parseReg(rs1), "imm": imm}
-        elif(instructionType == "S" ):
-            rs2, imm_rs1 = args.split(",")
-            imm,rs1 = imm_rs1.split("(")
-            rs1 = rs1.replace(")", "")
-            parsed = {"mnem": mnemonic, "rs1": parseReg(rs1), "rs2": parseReg(rs2), "imm": parseImm(imm,12,0)}
-        elif(instructionType == "B" ):
-            rs1, rs2, imm = args.split(",")
-            parsed = {"mnem": mnemonic, "rs1": parseReg(rs1), "rs2": parseReg(rs2), "imm": parseImm(imm,13,1)}
-        elif(instructionType == "U" ):
-            rd, imm = args.split(",")
-            parsed = {"mnem": mnemonic, "rd": parseReg(rd), "imm": parseImm(imm,20,0, False)<<12} # Imm parsing is modified to be consistent with general consensus
-        elif(instructionType == "J" ):
-            rd, imm = args.split(",")
-            parsed = {"mnem": mnemonic, "rd": parseReg(rd), "imm": parseImm(imm,21,1)}
+    def _checkHex(h):
+        # (parsed, None) or (None, message) if the word isn't a known instruction, without raising
+        decoder = Decoders.get(decodeKey(h))
+        if(decoder is None):
+            return None, f"Unknown instruction word 0x{h:08X}"
+        return decoder[1](h, decoder[0]), None
+    
+    def _checkStr(s, symbols=None, pc=0):
+        # (parsed, None, None), or (None, column, message) where column is the 0-based position of the problem in s
+        # Never raises, a bad line costs no exception unwinding. Labels in immediates are looked up in symbols
+        # (a SymbolTable), branch and jump targets are made relative to pc
+        if(";" in s): s = s.split(";")[0] #Ignore comments after ;
+        if("#" in s): s = s.split("#")[0] #Ignore comments after #
+        if("//" in s): s = s.split("//")[0] #Ignore comments after //
+        mnemonic, _, args = s.strip().partition(" ")
+        format = OperandFormats.get(mnemonic.upper())
+        if(format is None):
+            column = len(s)-len(s.lstrip())
+            if( len(mnemonic) == 0 ):
+                return None, column, "Missing instruction"
+            if( mnemonic.upper() in PseudoInstructions ):  # Only the ones that expand to 1 instruction, see _expandPseudo
+                expansion, _, message = RiscvInstruction._expandPseudo(s.strip())
+                if(message is None and len(expansion) != 1):
+                    message = f"{mnemonic.upper()} expands to {len(expansion)} instructions"
+                if(message is None):
+                    parsed, _, message = RiscvInstruction._checkStr(expansion[0], symbols, pc)
+                if(message is not None):
+                    return None, column, message
+                return parsed, None, None
+            return None, column, f"Unknown instruction '{mnemonic}'"
+        names, immBits, memoryForm, immShift, pcRelative = format
+        fields = args.split(",")
+        if( len(fields) != len(names)-memoryForm ):
+            given = 0 if len(args.strip()) == 0 else len(fields)
+            return None, RiscvInstruction._operandColumn(s, 0, False), f"{mnemonic.upper()} expects {len(names)-memoryForm} operands, got {given}"
+        if(memoryForm):
+            imm, bracket, rs1 = fields[1].rpartition("(")  # The last "(", imm can be "%lo(label)"
+            if( len(bracket) == 0 ):
+                return None, RiscvInstruction._operandColumn(s, 1, False), "Expected offset(register)"
+            fields = [fields[0], imm, rs1.replace(")", "")]
         
-        return parsed
-            
+        parsed = {"mnem": mnemonic.upper()}
+        for index,name in enumerate(names):
+            text = fields[index]
+            if(name == "imm"):
+                value = checkInt(text)
+                if(value is not None):
+                    message = checkImmRange(value, *immBits)
+                elif( len(text.strip()) == 0 ):
+                    message = "Missing immediate"
+                else:  # Not an integer, maybe a label
+                    value, message = RiscvInstruction._checkSymbolImm(text, immBits, immShift, pcRelative, symbols, pc)
+                if(message is not None):
+                    return None, RiscvInstruction._operandColumn(s, index, memoryForm), message
+            else:
+                value = RegisterMap.get(text.lower().strip())
+                if(value is None):
+                    message = "Missing register" if len(text.strip()) == 0 else f"Unknown register '{text.strip()}'"
+                    return None, RiscvInstruction._operandColumn(s, index, memoryForm), message
+            parsed[name] = value
+        if(immShift):
+            parsed["imm"] <<= immShift # U-type, imm parsing is modified to be consistent with general consensus
+        return parsed, None, None
+    
+    def _expandPseudo(s):
+        # (base instruction texts, None, None) or (None, column, message) for a pseudo-instruction without comments
+        # Operands are copied as written, labels in them are resolved when the base instructions are checked
+        mnemonic, _, args = s.partition(" ")
+        name = mnemonic.upper()
+        count, templates = PseudoInstructions[name]
+        operands = [] if len(args.strip()) == 0 else [operand.strip() for operand in args.split(",")]
+        if( len(operands) != count ):
+            return None, 0, f"{name} expects {count} operands, got {len(operands)}"
+        if(name == "LI"):
+            value = checkInt(operands[1])
+            if(value is None):
+                return None, len(mnemonic)+1+args.index(operands[1]), f"LI needs an integer, not '{operands[1]}' (LA loads addresses)"
+            if( not (-(1<<31) <= value < (1<<32)) ):
+                return None, len(mnemonic)+1+args.index(operands[1]), "Value doesn't fit to 32 bits"
+            return expandLI(operands[0], value), None, None
+        return [template.format(*operands) for template in templates], None, None
+    
+    def _checkSymbolImm(text, immBits, immShift, pcRelative, symbols, pc):
+        # Immediate that names a label: "label" for branches and jumps, "%hi(label)" for U-type, "%lo(label)" otherwise
+        if(symbols is None):
+            symbols = SymbolTable()
+        relocation = RelocationPattern.fullmatch(text)
+        if(relocation is not None):
+            kind, expression = relocation.groups()
+            if( (kind == "hi") != (immShift != 0) ):
+                return None, f"%{kind}() can't be used with this instruction"
+            target, message = symbols.evaluate(expression)
+            if(message is not None):
+                return None, message
+            hi = (target+0x800)>>12  # %lo() is signed, so %hi() rounds up when bit 11 is set
+            value = (hi & 0xFFFFF) if kind == "hi" else target-(hi<<12)
+        elif(pcRelative):
+            target, message = symbols.evaluate(text)
+            if(message is not None):
+                return None, message
+            value = target-pc
+        elif( SymbolPattern.fullmatch(text) is not None ):
+            return None, f"Use %hi({text.strip()}) or %lo({text.strip()}) for addresses"
+        else:
+            return None, f"Invalid immediate '{text.strip()}'"
+        message = checkImmRange(value, *immBits)
+        if(message is not None):
+            return None, message
+        return value, None
+    
+    def _operandColumn(s, index, memoryForm):
+        # 0-based position of operand index in s, only computed for error messages
+        mnemonic, _, args = s.strip().partition(" ")
+        column = len(s)-len(s.lstrip()) + len(mnemonic)+1
+        fields = args.split(",")
+        if(memoryForm and index > 0):
+            imm, bracket, rs1 = fields[1].rpartition("(")
+            fields = [fields[0], imm, rs1]
+        for field in fields[:index]:
+            column += len(field)+1
+        if(index < len(fields)):
+            column += len(fields[index])-len(fields[index].lstrip())
+        return min(column, len(s.rstrip()))
     
     def _generateHex(parsed):
-        mnem = parsed["mnem"]
-        info = InstructionDatabase[mnem]
-        type = info[0]
-        binary = 0x00000000
-        
-        if("rd" in parsed):
-            binary |= parsed["rd"]<<7
-        if("rs1" in parsed):
-            binary |= parsed["rs1"]<<15
-        if("rs2" in parsed):
-            binary |= parsed["rs2"]<<20
-        if(len(info)>1):
-            binary |= info[1] #opcode
-        if(len(info)>2):
-            binary |= info[2]<<12  #funct3
-        if(len(info)>3):
-            binary |= info[3]<<25  #funct7
-            
-        # Only immediates are left
-        if("imm" in parsed):
-            imm = parsed["imm"]
-            if(type in ["I","I2"]):
-                imm=imm%(1<<12)  # To fix negatives
-                binary |= imm<<20
-            elif(type == "S"):
-                imm=imm%(1<<12)  # To fix negatives
-                binary |= getBits(imm,11,5)<<25
-                binary |= getBits(imm,4,0)<<7
-            elif(type == "B"):
-                imm=imm%(1<<13)  # To fix negatives
-                binary |= getBits(imm,12,12)<<31
-                binary |= getBits(imm,10,5)<<25
-                binary |= getBits(imm,4,1)<<8
-                binary |= getBits(imm,11,11)<<7
-            elif(type == "U"):
-                imm=imm%(1<<32)  # To fix negatives
-                binary |= getBits(imm,31,12)<<12
-            elif(type == "J"):
-                imm=imm%(1<<32)  # To fix negatives
-                binary |= getBits(imm,20,20)<<31
-                binary |= getBits(imm,10,1)<<21
-                binary |= getBits(imm,11,11)<<20
-                binary |= getBits(imm,19,12)<<12
-                
-        
-        return binary
+        return Encoders[parsed["mnem"]](parsed)
     
     def _generateStr(parsed):
         mnem = parsed["mnem"]
@@ -330,51 +630,43 @@ class RiscvInstruction:
 
 
 
+def _riscv_expand_pseudo(body):
+    if( body.partition(" ")[0].upper() not in PseudoInstructions ):
+        return None
+    return RiscvInstruction._expandPseudo(body)
+
+riscv_check_word = RiscvInstruction.checkWord  # (text, None) or (None, message) if the word isn't a known instruction
+
+RiscvIsa = Isa("riscv", RiscvInstruction.checkInstruction, riscv_check_word, [";", "#", "//"], _riscv_expand_pseudo)
+Computer.isa = RiscvIsa
+Computer.instructionClass = RiscvInstruction
+
 def riscv_assemble(assembly_str):
-    lines = assembly_str.split("\n")
-    response_str=""
-    r = RiscvInstruction()
-    for line in lines:
-        line=line.split(":")[-1]
-        line=line.strip()
-        if( len(line) == 0 ):
-            response_str += "\n"
-            continue
-        try:
-            r.fromStr(line)
-            hex_str = f"{r.h:08X}"
-            hex_str = hex_str[6:8]+" "+hex_str[4:6]+" "+hex_str[2:4]+" "+hex_str[0:2] # Reverse byte order
-            response_str += f"{hex_str}\n"
-        except Exception as e:
-            response_str += f"ERROR\n"
-            print(f"Exception occured: {e}")
-    return response_str[:-1]
+    return "\n".join(riscv_assemble_lines(assembly_str.split("\n")))
+
+# See isa.assembler.Isa for what each of these does
+riscv_assemble_lines = RiscvIsa.assembleLines
+riscv_assemble_line = RiscvIsa.assembleLine
+riscv_check_line = RiscvIsa.checkLine
+riscv_encode_line = RiscvIsa.encodeLine
+riscv_assemble_checked = RiscvIsa.assembleChecked
+riscv_assemble_program = RiscvIsa.assembleProgram
+riscv_assemble_bytes = RiscvIsa.assembleBytes
 
 def riscv_disassemble(hex_str):
-    lines = hex_str.split("\n")
-    response_str=""
-    r = RiscvInstruction()
-    address=0
-    for line in lines:
-        line=line.strip()
-        line=line.replace("_","").replace(" ","")
-        if( len(line) == 0 ):
-            response_str += "\n"
-            continue
-        response_str += f"_{address:02X}: "
-        address += 4
-        if( len(line) != 8 ):
-            response_str += "ERROR\n"
-            continue
-        try:
-            line = line[6:8]+line[4:6]+line[2:4]+line[0:2] # Reverse byte order
-            inst_hex = int(line,16)
-            r.fromHex(inst_hex)
-            response_str += f"{r.s}\n"
-        except Exception as e:
-            response_str += f"ERROR\n"
-            print(f"Exception occured: {e}")
-    return response_str[:-1]
+    return "\n".join(riscv_disassemble_lines(hex_str.split("\n")))
+
+riscv_disassemble_lines = RiscvIsa.disassembleLines
+riscv_disassemble_hex_line = RiscvIsa.disassembleHexLine
+riscv_check_hex_line = checkHexLine
+riscv_parse_hex_line = parseHexLine
+riscv_disassemble_word = RiscvIsa.disassembleWord
+riscv_decode_word = RiscvIsa.decodeWord
+riscv_disassemble_checked = RiscvIsa.disassembleChecked
+riscv_disassemble_bytes_lines = RiscvIsa.disassembleBytesLines
+
+def riscv_disassemble_bytes(program_bytes):
+    return "\n".join(riscv_disassemble_bytes_lines(program_bytes))
 
 if __name__ == "__main__":
     with open("session_instr.s","r") as f:
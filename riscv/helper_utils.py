@@ -1,5 +1,9 @@
 #!/usr/bin/env python3
 
+import re
+
+from isa.helper_utils import *
+
 # https://msyksphinz-self.github.io/riscv-isadoc/html/rvi.html
 
 """       1       2       3
@@ -77,10 +81,117 @@ InstructionDatabase = {
 }
 
 
+# Decode index: (opcode, funct3, funct7) -> list of matching mnemonics
+# Fields an instruction type doesn't use are don't-cares, so every combination is expanded once at import time
+def generateDecodeTable():
+    table = {}
+    for mnem,value in InstructionDatabase.items():
+        type = value[0]
+        opcode = value[1]
+        for funct3 in range(8):
+            if( type in ["R","I","I2","S","B"] and funct3!=value[2] ):
+                continue
+            for funct7 in range(128):
+                if( type in ["R","I2"] and funct7!=value[3] ):
+                    continue
+                table.setdefault( (opcode,funct3,funct7), [] ).append(mnem)
+    return table
+
+DecodeTable = generateDecodeTable()
+
+# Operand fields per instruction type, see isa.helper_utils.makeFieldParser
+FieldLayouts = {
+    "R":  [("rd", [(11,7,0)], 0), ("rs1", [(19,15,0)], 0), ("rs2", [(24,20,0)], 0)],
+    "I":  [("rd", [(11,7,0)], 0), ("rs1", [(19,15,0)], 0), ("imm", [(31,20,0)], 12)],
+    "I2": [("rd", [(11,7,0)], 0), ("rs1", [(19,15,0)], 0), ("imm", [(24,20,0)], 0)],
+    "S":  [("rs1", [(19,15,0)], 0), ("rs2", [(24,20,0)], 0), ("imm", [(31,25,5), (11,7,0)], 12)],
+    "B":  [("rs1", [(19,15,0)], 0), ("rs2", [(24,20,0)], 0), ("imm", [(31,31,12), (30,25,5), (11,8,1), (7,7,11)], 13)],
+    "U":  [("rd", [(11,7,0)], 0), ("imm", [(31,12,12)], 0)],
+    "J":  [("rd", [(11,7,0)], 0), ("imm", [(31,31,20), (30,21,1), (20,20,11), (19,12,12)], 21)],
+}
+# The shift amount is encoded like an I-type immediate, funct7 comes from the database
+EncodeLayouts = dict(FieldLayouts, I2=FieldLayouts["I"])
+
+FieldParsers = {type: makeFieldParser(layout) for type,layout in FieldLayouts.items()}
+
+# word -> (opcode, funct3, funct7), the DecodeTable key
+decodeKey = makeFieldExtractor([("opcode", [(6,0,0)], 0), ("funct3", [(14,12,0)], 0), ("funct7", [(31,25,0)], 0)])
+
+# Single-match DecodeTable entries: key -> (mnemonic, fn(word, mnemonic) -> parsed dict)
+Decoders = {key: (matches[0], FieldParsers[InstructionDatabase[matches[0]][0]]) for key,matches in DecodeTable.items() if len(matches) == 1}
+
+# mnemonic -> fn(parsed) -> instruction word, opcode, funct3 and funct7 are constants of the function
+def generateEncoders():
+    encoders = {}
+    for mnem,info in InstructionDatabase.items():
+        fixed = info[1]
+        if(len(info)>2): fixed |= info[2]<<12
+        if(len(info)>3): fixed |= info[3]<<25
+        encoders[mnem] = makeFieldEncoder(EncodeLayouts[info[0]], fixed)
+    return encoders
+
+Encoders = generateEncoders()
+
+# Assembly operand layout: mnemonic -> (operand names in source order, checkImm bits, "reg, offset(rs1)" form, imm shift,
+# labels are PC-relative)
+def generateOperandFormats():
+    formats = {}
+    immBits = {"I": (12,0,True), "I2": (5,0,False), "S": (12,0,True), "B": (13,1,True), "U": (20,0,False), "J": (21,1,True)}
+    for mnem,value in InstructionDatabase.items():
+        type = value[0]
+        memoryForm = type == "S" or mnem in ["LB","LH","LW","LBU","LHU","JALR"]
+        if(memoryForm):            names = ("rs2" if type == "S" else "rd", "imm", "rs1")
+        elif(type == "R"):         names = ("rd", "rs1", "rs2")
+        elif(type == "B"):         names = ("rs1", "rs2", "imm")
+        elif(type in ["U","J"]):   names = ("rd", "imm")
+        else:                      names = ("rd", "rs1", "imm")
+        formats[mnem] = (names, immBits.get(type), memoryForm, 12 if type == "U" else 0, type in ["B","J"])
+    return formats
+
+OperandFormats = generateOperandFormats()
+
+
 PseudoInstructions = { # https://github.com/riscv-non-isa/riscv-asm-manual/blob/main/riscv-asm.md
-    "NOP", "MV", "NOT", "NEG", "BLTE", "BLTEU", "BGT", "BGTU", "J", "BranchZ", "LI"
+    # mnemonic: (operand count, base instructions), {0}, {1}... are replaced by the operands as written
+    "NOP":  (0, ["ADDI x0, x0, 0"]),
+    "MV":   (2, ["ADDI {0}, {1}, 0"]),
+    "NOT":  (2, ["XORI {0}, {1}, -1"]),
+    "NEG":  (2, ["SUB {0}, x0, {1}"]),
+    "SEQZ": (2, ["SLTIU {0}, {1}, 1"]),
+    "SNEZ": (2, ["SLTU {0}, x0, {1}"]),
+    "SLTZ": (2, ["SLT {0}, {1}, x0"]),
+    "SGTZ": (2, ["SLT {0}, x0, {1}"]),
+    "BEQZ": (2, ["BEQ {0}, x0, {1}"]),
+    "BNEZ": (2, ["BNE {0}, x0, {1}"]),
+    "BLEZ": (2, ["BGE x0, {0}, {1}"]),
+    "BGEZ": (2, ["BGE {0}, x0, {1}"]),
+    "BLTZ": (2, ["BLT {0}, x0, {1}"]),
+    "BGTZ": (2, ["BLT x0, {0}, {1}"]),
+    "BGT":  (3, ["BLT {1}, {0}, {2}"]),
+    "BLE":  (3, ["BGE {1}, {0}, {2}"]),
+    "BGTU": (3, ["BLTU {1}, {0}, {2}"]),
+    "BLEU": (3, ["BGEU {1}, {0}, {2}"]),
+    "J":    (1, ["JAL x0, {0}"]),
+    "JR":   (1, ["JALR x0, 0({0})"]),
+    "RET":  (0, ["JALR x0, 0(x1)"]),
+    "CALL": (1, ["JAL x1, {0}"]),
+    "LA":   (2, ["LUI {0}, %hi({1})", "ADDI {0}, {0}, %lo({1})"]),  # Absolute, .data labels are DataMemory addresses
+    "LI":   (2, None),  # Shortest sequence for the value, see expandLI
 }
 
+def expandLI(rd, value):
+    # ADDI if value fits to 12 bits, LUI if its low 12 bits are 0, LUI+ADDI otherwise
+    # 0xFFFFFFFF and -1 are the same register value, the range check is done on the signed form
+    value = signed(value & 0xFFFFFFFF, 32)
+    if( -2048 <= value < 2048 ):
+        return [f"ADDI {rd}, x0, {value}"]
+    value &= 0xFFFFFFFF
+    lo = signed(value & 0xFFF, 12)
+    hi = ((value-lo)>>12) & 0xFFFFF  # ADDI sign-extends lo, so hi is rounded up when bit 11 is set
+    if(lo == 0):
+        return [f"LUI {rd}, {hi}"]
+    return [f"LUI {rd}, {hi}", f"ADDI {rd}, {rd}, {lo}"]
+
 
 RegisterMap = {
     "x0" : 0,
@@ -153,49 +264,39 @@ RegisterMap = {
 
 
 
-def parseReg(regString):
-    return RegisterMap[regString.lower().strip()]
+parseReg, checkReg = makeRegisterParsers(RegisterMap)
 
 def parseImm(immString, hiBit=32, loBit=0, signed=True):
-    value = int(immString, 0)
+    value, message = checkImm(immString, hiBit, loBit, signed)
+    if(message is not None):
+        raise ValueError(message)
+    return value
+
+def checkImm(immString, hiBit=32, loBit=0, signed=True):
+    # (value, None) or (None, error message), never raises
+    value = checkInt(immString)
+    if(value is None):
+        if( len(immString.strip()) == 0 ):
+            return None, "Missing immediate"
+        return None, f"Invalid immediate '{immString.strip()}'"
+    message = checkImmRange(value, hiBit, loBit, signed)
+    if(message is not None):
+        return None, message
+    return value, None
+
+def checkImmRange(value, hiBit=32, loBit=0, signed=True):
+    # Error message if value can't be encoded, None otherwise
     if(not signed and value<0):
-        raise ValueError('Immediate value error: It should not be negative')
+        return 'Immediate value error: It should not be negative'
     if( (value & ((1<<loBit)-1)) != 0):
-        raise ValueError(f'Immediate value error: Last {loBit} bits must be 0')
+        return f'Immediate value error: Last {loBit} bits must be 0'
     if(not signed and value>=(1<<hiBit) ):
-        raise ValueError(f"Immediate value error: Unsigned value doesn't fit to {hiBit} bits")
+        return f"Immediate value error: Unsigned value doesn't fit to {hiBit} bits"
     if(signed and (value>=(1<<(hiBit-1)) or (value<-(1<<(hiBit-1)) ) ) ):
-        raise ValueError(f"Immediate value error: Signed value doesn't fit to {hiBit} bits")
+        return f"Immediate value error: Signed value doesn't fit to {hiBit} bits"
     #if(signed and value<0):
     #    value += 1<<hiBit
-    return value
-
-def num2str(num):
-    if(num<1000 and num>-1000):
-        return str(num)
-    else:
-        if(num<0):
-            return f"-0x{-num:X}"
-        else:
-            return f"0x{num:X}"
-    
-def signed(value, bitlen=32):
-    if( (value>>(bitlen-1)) > 0 ):
-        value -= 1<<(bitlen)
-    return value
-
-def unsigned(value, bitlen=32):
-    return value % (1<<bitlen)
-
-def getBits(num, high, low):
-    num = num & ( ( 1<<(high+1) )-1 )
-    return num>>low
-
-def num2Hex(num):
-    hex_str=f"{num:08x}"
-    #hex_str = hex_str[::-1]
-    hex_str = hex_str[0:4] + "_" + hex_str[4:8]
-    return "0x"+hex_str
-
-
+    return None
 
+# %hi(label) and %lo(label) operands
+RelocationPattern = re.compile(r"\s*%(hi|lo)\((.*)\)\s*")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# pip install numpy
+
+# Bulk disassembler: fields of every word are extracted with NumPy array operations,
+# Python only runs once per word to format the final text
+
+import numpy as np
+
+from riscv.helper_utils import *
+
+Mnemonics = list(InstructionDatabase)
+TypeCodes = {"R":0, "I":1, "I2":2, "S":3, "B":4, "U":5, "J":6}
+
+def generateMnemonicLUT():
+    # Index (opcode | funct3<<7 | funct7<<10) -> index in Mnemonics, -1 when DecodeTable doesn't have exactly 1 match
+    lut = np.full(1<<17, -1, dtype=np.int16)
+    for (opcode,funct3,funct7),matches in DecodeTable.items():
+        if(len(matches) == 1):
+            lut[opcode | (funct3<<7) | (funct7<<10)] = Mnemonics.index(matches[0])
+    return lut
+
+def generateTemplates():
+    # Text layout per mnemonic, the same as RiscvInstruction._generateStr
+    templates = []
+    for mnem in Mnemonics:
+        type = InstructionDatabase[mnem][0]
+        prefix = mnem.lower() + (" "*(8-len(mnem)))
+        if(type=="R"):
+            templates.append(prefix + "x{rd}, x{rs1}, x{rs2}")
+        elif(type=="I" and mnem in ["LB","LH","LW","LBU","LHU","JALR"]):
+            templates.append(prefix + "x{rd}, {imm}(x{rs1})")
+        elif(type in ["I","I2"]):
+            templates.append(prefix + "x{rd}, x{rs1}, {imm}")
+        elif(type=="S"):
+            templates.append(prefix + "x{rs2}, {imm}(x{rs1})")
+        elif(type=="B"):
+            templates.append(prefix + "x{rs1}, x{rs2}, {imm}")
+        elif(type in ["U","J"]):
+            templates.append(prefix + "x{rd}, {imm}")
+    return templates
+
+MnemonicLUT = generateMnemonicLUT()
+MnemonicTypes = np.array([TypeCodes[InstructionDatabase[mnem][0]] for mnem in Mnemonics], dtype=np.int8)
+Templates = generateTemplates()
+
+
+def _signExtend(value, bitlen):
+    return (value ^ (1<<(bitlen-1))) - (1<<(bitlen-1))
+
+def decode_words(words):
+    # Vectorized equivalent of RiscvInstruction._parseFromHex for an array of uint32 words
+    # Returns a dict of int64 arrays, "mnem" indexes Mnemonics (-1 for illegal words) and "imm" is already
+    # the value _generateStr prints (the upper 20 bits for U-type)
+    w = np.asarray(words, dtype=np.uint32).astype(np.int64)
+    opcode = w & 0x7F
+    funct3 = (w>>12) & 0x7
+    funct7 = (w>>25) & 0x7F
+    mnem = MnemonicLUT[opcode | (funct3<<7) | (funct7<<10)].astype(np.int64)
+    type = np.where(mnem >= 0, MnemonicTypes[mnem], -1)
+
+    immI = _signExtend(w>>20, 12)
+    immI2 = (w>>20) & 0x1F
+    immS = _signExtend( ((w>>25)<<5) | ((w>>7) & 0x1F), 12)
+    immB = _signExtend( (((w>>31) & 0x1)<<12) | (((w>>25) & 0x3F)<<5) | (((w>>8) & 0xF)<<1) | (((w>>7) & 0x1)<<11), 13)
+    immU = w>>12
+    immJ = _signExtend( (((w>>31) & 0x1)<<20) | (((w>>21) & 0x3FF)<<1) | (((w>>20) & 0x1)<<11) | (((w>>12) & 0xFF)<<12), 21)
+    imm = np.select(
+        [type==TypeCodes["I"], type==TypeCodes["I2"], type==TypeCodes["S"], type==TypeCodes["B"], type==TypeCodes["U"], type==TypeCodes["J"]],
+        [immI, immI2, immS, immB, immU, immJ], 0)
+
+    return {"mnem": mnem, "type": type, "opcode": opcode, "funct3": funct3, "funct7": funct7,
+            "rd": (w>>7) & 0x1F, "rs1": (w>>15) & 0x1F, "rs2": (w>>20) & 0x1F, "imm": imm}
+
+def disassemble_words(words):
+    # List with the _generateStr text of each word, "ERROR" for illegal words
+    fields = decode_words(words)
+    result = []
+    for mnem,type,rd,rs1,rs2,imm in zip(*[fields[key].tolist() for key in ["mnem","type","rd","rs1","rs2","imm"]]):
+        if(mnem < 0):
+            result.append("ERROR")
+            continue
+        immText = str(imm) if type==TypeCodes["I2"] else num2str(imm)
+        result.append(Templates[mnem].format(rd=rd, rs1=rs1, rs2=rs2, imm=immText))
+    return result
+
+def disassemble_bytes(program_bytes):
+    # Same output and errors as riscv.computer.riscv_disassemble_bytes
+    words = np.frombuffer(wordBytes(program_bytes), dtype="<u4")
+    return "\n".join(f"_{4*i:02X}: {text}" for i,text in enumerate(disassemble_words(words)))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import riscv
+import arm
+from server_cache import LRUCache
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 0)) or os.cpu_count() or 1  # Processes per server process, gunicorn.conf.py splits the cores
+BATCH_INLINE_LINES = 4096   # Batches with fewer source lines are converted in the request thread
+BATCH_CHUNK_SIZE = 4        # Jobs sent to a worker process at a time
+BATCH_LINE_CACHE_SIZE = 1<<16
+
+"""
+Job (dict):
+    "id":       anything, copied to the result
+    "op":       "assemble" | "disassemble"
+    "program":  assembly or hex text, the body of /<arch>/assemble_api or /<arch>/disassemble_api
+
+Result (dict):
+    "id":       the "id" of the job
+    "ok":       True if every line was converted
+    "output":   the same text /<arch>/assemble_api or /<arch>/disassemble_api returns, "ERROR" on bad lines
+    "errors":   [{"line": n, "column": c, "message": reason, "source": text}, ...]  n and c count from 1
+    "error":    message when the job itself is malformed (no "output" then)
+"""
+
+# Non-raising converters per (architecture, op), see isa.assembler.Isa.assembleChecked
+Converters = {
+    ("riscv", "assemble"):    riscv.computer.riscv_assemble_checked,
+    ("riscv", "disassemble"): riscv.computer.riscv_disassemble_checked,
+    ("arm", "assemble"):      arm.computer.assemble_checked,
+    ("arm", "disassemble"):   arm.computer.disassemble_checked,
+}
+
+lineCaches = {key: LRUCache(BATCH_LINE_CACHE_SIZE) for key in Converters}  # One set per process
+
+def convert_job(arch, job):
+    if( not isinstance(job, dict) ):
+        return {"id": None, "ok": False, "error": "Job must be an object"}
+    op = job.get("op", "assemble")
+    program = job.get("program")
+    if( (arch, op) not in Converters ):
+        return {"id": job.get("id"), "ok": False, "error": f"Unknown op '{op}'"}
+    if( not isinstance(program, str) ):
+        return {"id": job.get("id"), "ok": False, "error": "\"program\" must be a string"}
+    outputs, errors = Converters[(arch, op)](program.split("\n"), lineCaches[(arch, op)])
+    return {"id": job.get("id"), "ok": len(errors) == 0, "output": "\n".join(outputs), "errors": [error.toDict() for error in errors]}
+
+def _convert_job_args(args):
+    return convert_job(*args)
+
+_executor = None
+_executorLock = threading.Lock()
+
+def _get_executor():
+    # Started on first use, inside the server worker process. forkserver children don't inherit the
+    # locks other request threads may hold at that moment
+    global _executor
+    with _executorLock:
+        if(_executor is None):
+            _executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context("forkserver"))
+        return _executor
+
+def run_batch_jobs(arch, jobs):
+    # Results are returned in job order. Small batches aren't worth the pickling, they run in the calling thread
+    args = [(arch, job) for job in jobs]
+    lines = sum(job["program"].count("\n")+1 for job in jobs if isinstance(job, dict) and isinstance(job.get("program"), str))
+    if( BATCH_WORKERS == 1 or len(args) <= 1 or lines < BATCH_INLINE_LINES ):
+        return [_convert_job_args(a) for a in args]
+    return list(_get_executor().map(_convert_job_args, args, chunksize=BATCH_CHUNK_SIZE))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    # Bounded mapping that evicts the least recently used entry, with hit/miss counters
+    # get()/[]= are enough for the assemble_lines/disassemble_lines caches of both architectures
+    # With maxBytes the entries are also bounded by the sum of sizeOf(value), a value bigger than that isn't kept
+    def __init__(self, maxSize, maxBytes=None, sizeOf=len):
+        self.maxSize = maxSize
+        self.maxBytes = maxBytes
+        self.sizeOf = sizeOf
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._sizes = {}  # sizeOf() of every value, with maxBytes
+        self._lock = threading.Lock()  # The development server handles requests in threads
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, self)
+            if(value is self):
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def __setitem__(self, key, value):
+        if(self.maxBytes is None):
+            with self._lock:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                if( len(self._data) > self.maxSize ):
+                    self._data.popitem(last=False)
+            return
+        size = self.sizeOf(value)
+        if(size > self.maxBytes):
+            return
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while( len(self._data) > self.maxSize or self.bytes > self.maxBytes ):
+                oldKey, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(oldKey)
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {"size": len(self._data), "maxSize": self.maxSize, "hits": self.hits, "misses": self.misses,
+                 "hitRate": self.hits/lookups if lookups else 0.0}
+        if(self.maxBytes is not None):
+            stats.update(bytes=self.bytes, maxBytes=self.maxBytes)
+        return stats
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import threading
+
+from isa.assembler import IncrementalProgram
+
+class IncrementalDocument:
+    # Server-side copy of an editor buffer and its converted output, kept line by line
+    # Each edit replaces source lines [start, end) and only converts the new lines
+    #
+    # convertLines(lines) yields one output line per source line. With addressed=True (disassembly) it yields
+    # None for lines that don't take an address and the text after the "_XX: " prefix otherwise
+    def __init__(self, convertLines, addressed=False):
+        self.convertLines = convertLines
+        self.addressed = addressed
+        self.bodies = []   # convertLines() result per source line
+        self.outputs = []  # Output line per source line
+        self.lock = threading.Lock()
+    
+    def replace(self, start, end, lines):
+        # Returns (start, end, outputLines): the client replaces its output lines [start, end) with outputLines
+        with self.lock:
+            if( not (0 <= start <= end <= len(self.bodies)) ):
+                raise ValueError(f"Line range [{start}, {end}) is outside of the document ({len(self.bodies)} lines)")
+            newBodies = list(self.convertLines(lines))
+            oldLength = len(self.bodies)
+            if(not self.addressed):
+                self.bodies[start:end] = newBodies
+                self.outputs[start:end] = newBodies
+                return start, end, newBodies
+
+            # Inserting or removing an instruction moves the address of every instruction after it
+            shifted = sum(body is not None for body in newBodies) != sum(body is not None for body in self.bodies[start:end])
+            self.bodies[start:end] = newBodies
+            stop = len(self.bodies) if shifted else start+len(newBodies)
+            address = 4*sum(body is not None for body in self.bodies[:start])
+            outputs = []
+            for body in self.bodies[start:stop]:
+                if(body is None):
+                    outputs.append("")
+                else:
+                    outputs.append(f"_{address:02X}: {body}")
+                    address += 4
+            if(shifted):
+                self.outputs[start:] = outputs
+                return start, oldLength, outputs
+            self.outputs[start:end] = outputs
+            return start, end, outputs
+
+    def text(self):
+        with self.lock:
+            return "\n".join(self.outputs)
+
+
+class IncrementalAssembly:
+    # IncrementalDocument of assembly, where labels make the output of a line depend on the others
+    # isa.assembler.IncrementalProgram keeps what an edit needs to find the lines it changes
+    def __init__(self, isa, lineCache=None):
+        self.program = IncrementalProgram(isa, lineCache)
+        self.lock = threading.Lock()
+    
+    def replace(self, start, end, lines):
+        # Same as IncrementalDocument.replace
+        with self.lock:
+            return self.program.replace(start, end, lines)
+    
+    def text(self):
+        with self.lock:
+            return self.program.text()
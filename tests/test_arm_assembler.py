@@ -0,0 +1,11 @@
+import arm.computer as A
+
+def test_unknown_label_isnt_cached():
+    # A line that named a missing label must be assembled again once the label exists
+    cache = {}
+    assert list(A.assemble_lines(["b foo"], cache)) == ["ERROR"]
+    assert list(A.assemble_lines(["foo: mov r0, r0", "b foo"], cache)) == ["00 00 A0 E1", "FD FF FF EA"]
+
+def test_branch_to_forward_and_backward_labels():
+    lines = ["start: b end", "mov r0, r0", "end: bl start"]
+    assert list(A.assemble_lines(lines)) == ["00 00 00 EA", "00 00 A0 E1", "FC FF FF EB"]
@@ -0,0 +1,114 @@
+import random
+
+from arm.computer import Computer, FlagOps, TraceLevels, decode_word, encode_line
+
+def run(program, **registers):
+    comp = Computer(trace=TraceLevels.NONE)
+    comp.compile_from_assembly(program)
+    for reg,value in registers.items():
+        comp.RF[int(reg[1:])] = value
+    comp.run()
+    return comp
+
+# Copy-on-write of snapshot/fork/clone
+
+def test_snapshot_clone_write_restore():
+    comp = Computer(trace=TraceLevels.NONE)
+    comp.writeData(0, 17)
+    snapshot = comp.snapshot()
+    comp.clone()
+    comp.writeData(0, 34)
+    comp.restore(snapshot)
+    assert comp.readData(0) == 17
+
+def test_fork_doesnt_see_later_writes():
+    comp = Computer(trace=TraceLevels.NONE)
+    other = comp.fork()
+    comp.clone()
+    comp.writeData(0, 5)
+    assert other.readData(0) == 0
+    other.writeData(4, 6)
+    assert comp.readData(4) == 0
+
+def test_clone_is_independent():
+    comp = run("MOV r1, #7\nSTR r1, [r0]")
+    other = comp.clone()
+    other.writeData(0, 9)
+    other.writeInstruction(0, 0)
+    other.RF[1] = 0
+    assert comp.readData(0) == 7 and comp.IMem[0] != 0 and comp.RF[1] == 7
+    assert other.getFlags() == comp.getFlags()
+
+def test_restore_undoes_writes_and_flags():
+    comp = run("MOV r1, #1\nCMP r1, #1")
+    snapshot = comp.snapshot()
+    comp.writeData(8, 3)
+    comp.setArithmeticFlags(FlagOps.SUB, 0, 1, -1)
+    comp.restore(snapshot)
+    assert comp.readData(8) == 0
+    assert comp.getFlags() == (0, 1, 1, 0)
+
+# Lazy flags
+
+def eager_flags(kind, a, b):
+    # Reference N, Z, C, V computed directly from the operands
+    result = (a+b if kind == "add" else a-b) & 0xFFFFFFFF
+    if(kind == "add"):
+        carry = int(a+b > 0xFFFFFFFF)
+        overflow = int((a>>31) == (b>>31) != (result>>31))
+    else:
+        carry = int(a >= b)
+        overflow = int((a>>31) != (b>>31) and (result>>31) != (a>>31))
+    return result>>31, int(result == 0), carry, overflow
+
+def test_arithmetic_flags_match_eager_model():
+    rng = random.Random(1)
+    edges = [0, 1, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFF]
+    for _ in range(2000):
+        a = rng.choice(edges + [rng.getrandbits(32)])
+        b = rng.choice(edges + [rng.getrandbits(32)])
+        for name,kind in [("ADDS", "add"), ("SUBS", "sub")]:
+            comp = run(f"{name} r2, r0, r1", r0=a, r1=b)
+            assert comp.getFlags() == eager_flags(kind, a, b), (name, a, b)
+
+def test_logic_flags_keep_v_and_take_c_from_the_shifter():
+    comp = run("ADDS r2, r0, r0\nMOVS r3, r1, LSR #1", r0=0x80000000, r1=1)
+    assert comp.getFlags() == (0, 1, 1, 1)  # C is the bit shifted out, V from the ADDS
+    comp = run("ADDS r2, r0, r0\nANDS r3, r1, r1", r0=0x80000000, r1=0x80000000)
+    assert comp.getFlags() == (1, 0, 1, 1)  # No shift, C and V from the ADDS
+
+def test_rotated_immediate_carry_follows_the_rotate_field():
+    # #0x3F is also imm8=0xFC rotated right by 2, a non-canonical encoding with rot=1: C becomes bit 31, 0
+    word = 0xE3B011FC
+    assert (word >> 8) & 0xF == 1 and decode_word(word) == "movs    r1, #63"
+    assert (encode_line("MOVS r1, #63") >> 8) & 0xF == 0
+    for program,carry in [("MOVS r1, #63", 1), ("MOVS r1, #0x3F0", 0), ("MOVS r1, #0xF0000000", 1)]:
+        comp = Computer(trace=TraceLevels.NONE)
+        comp.compile_from_assembly("CMP r0, #0\n" + program)  # C=1 before
+        assert comp.run().reason == "halt" and comp.getFlags()[2] == carry, program
+    comp = Computer(trace=TraceLevels.NONE)
+    comp.compile_from_assembly("CMP r0, #0")
+    comp.writeInstruction(4, word)
+    comp.run()
+    assert comp.RF[1] == 0x3F and comp.getFlags() == (0, 0, 0, 0)
+
+def test_conditions():
+    comp = Computer(trace=TraceLevels.NONE)
+    for flags in range(16):
+        N, Z, C, V = flags>>3 & 1, flags>>2 & 1, flags>>1 & 1, flags & 1
+        comp.flagState = (FlagOps.NZCV, N, Z, C, V)
+        expected = {"EQ": Z, "NE": not Z, "CS": C, "CC": not C, "MI": N, "PL": not N, "VS": V, "VC": not V,
+                    "HI": C and not Z, "LS": (not C) or Z, "GE": N == V, "LT": N != V, "GT": not Z and N == V,
+                    "LE": Z or N != V}
+        for cond,value in expected.items():
+            assert bool(comp.conditionPassed(cond)) == bool(value), (cond, flags)
+        assert comp.conditionPassed("")
+
+def test_eq_ne_without_materializing_flags():
+    comp = run("SUBS r2, r0, r1", r0=5, r1=5)
+    assert comp.conditionPassed("EQ") and not comp.conditionPassed("NE")
+    assert comp.flagState[0] == FlagOps.SUB
+
+def test_conditional_execution():
+    comp = run("MOV r0, #5\nCMP r0, #6\nMOVLT r1, #1\nMOVGE r2, #1\nADDNE r3, r0, #1")
+    assert comp.RF[1:4] == [1, 0, 6]
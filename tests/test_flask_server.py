@@ -0,0 +1,122 @@
+import pytest
+
+pytest.importorskip("flask")
+
+import flask_server
+
+@pytest.fixture
+def client():
+    flask_server.documents.clear()
+    return flask_server.create_app().test_client()
+
+def post(client, body, arch="riscv"):
+    response = client.post(f"/{arch}/incremental_api", json=body)
+    return response.status_code, response.get_json()
+
+Conversions = [
+    ("/riscv/assemble_api", "addi x1, x0, 1\njal x0, 0", "93 00 10 00\n6F 00 00 00"),
+    ("/riscv/disassemble_api", "93 00 10 00\nzz", "_00: addi    x1, x0, 1\n_04: ERROR"),
+    ("/arm/assemble_api", "ADD r0, r1, r2\nfoo", "02 00 81 E0\nERROR"),
+    ("/arm/disassemble_api", "02 00 81 E0\nzz", "_00: add     r0, r1, r2\n_04: ERROR"),
+]
+
+@pytest.mark.parametrize("path,body,output", Conversions)
+def test_conversion_routes(client, path, body, output):
+    flask_server.requestCache.clear()
+    for _ in range(2):  # The second request is answered from requestCache
+        response = client.post(path, data=body)
+        assert response.status_code == 200 and response.get_data(as_text=True) == output
+    assert flask_server.requestCache.hits == 1
+    result = client.post(path + "?format=json", data=body).get_json()
+    assert result["output"] == output and result["ok"] == ("ERROR" not in output)
+
+def test_request_cache_is_bounded_by_bytes(client, monkeypatch):
+    cache = flask_server.requestCache
+    monkeypatch.setattr(cache, "maxBytes", 40)
+    cache.clear()
+    for value in range(4):
+        client.post("/riscv/assemble_api", data=f"addi x1, x0, {value}\nnop")  # 23 characters of output
+    client.post("/riscv/assemble_api", data="nop\n"*4)  # 48, not kept
+    assert (len(cache), cache.bytes) == (1, 23)
+    assert client.get("/cache_stats").get_json()["request"]["bytes"] == 23
+
+def test_line_cache_is_independent_of_addresses(client):
+    cache = flask_server.lineCaches["riscv/disassemble"]
+    cache.clear()
+    response = client.post("/riscv/disassemble_api", data="93 00 10 00\n93 00 10 00")
+    assert response.get_data(as_text=True) == "_00: addi    x1, x0, 1\n_04: addi    x1, x0, 1"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_index_and_cache_stats(client):
+    assert client.get("/").status_code == 200
+    assert set(client.get("/cache_stats").get_json()) == {"request", *flask_server.lineCaches}
+
+def test_incremental_disassembly_moves_addresses(client):
+    lines = ["93 00 10 00", "", "93 00 10 00"]
+    assert post(client, {"doc": 1, "op": "disassemble", "full": True, "lines": lines}) == \
+        (200, {"full": True, "lines": ["_00: addi    x1, x0, 1", "", "_04: addi    x1, x0, 1"]})
+    # An instruction in place of the empty line moves every address after it
+    assert post(client, {"doc": 1, "op": "disassemble", "start": 1, "end": 2, "lines": ["93 00 10 00"]}) == \
+        (200, {"start": 1, "end": 3, "lines": ["_04: addi    x1, x0, 1", "_08: addi    x1, x0, 1"]})
+
+def test_incremental_assembly(client):
+    assert post(client, {"doc": 1, "full": True, "lines": ["addi x1, x0, 1", "addi x2, x0, 2"]}) == \
+        (200, {"full": True, "lines": ["93 00 10 00", "13 01 20 00"]})
+    assert post(client, {"doc": 1, "start": 1, "end": 2, "lines": ["addi x2, x0, 3"]}) == (200, {"start": 1, "end": 2, "lines": ["13 01 30 00"]})
+
+def test_incremental_assembly_with_labels(client):
+    assert post(client, {"doc": 1, "full": True, "lines": ["jal x0, end", "addi x1, x1, 1", "end: addi x0, x0, 0"]}) == \
+        (200, {"full": True, "lines": ["6F 00 80 00", "93 80 10 00", "13 00 00 00"]})
+    # Removing the middle line moves "end", the jump before the edit changes too
+    assert post(client, {"doc": 1, "start": 1, "end": 2, "lines": []}) == (200, {"start": 0, "end": 2, "lines": ["6F 00 40 00"]})
+
+def test_incremental_assembly_of_several_words(client):
+    lines = ["li x1, 0x12345678", "nop", ".word 1, 2"]
+    status, result = post(client, {"doc": 1, "full": True, "lines": lines})
+    assert status == 200 and result["lines"] == ["B7 50 34 12\n93 80 80 67", "13 00 00 00", "01 00 00 00\n02 00 00 00"]
+    assert "\n".join(result["lines"]) == client.post("/riscv/assemble_api", data="\n".join(lines)).get_data(as_text=True)
+    # Still one element per source line when an edit adds words
+    assert post(client, {"doc": 1, "start": 1, "end": 2, "lines": ["li x2, 0x12345678"]}) == \
+        (200, {"start": 1, "end": 2, "lines": ["37 51 34 12\n13 01 81 67"]})
+
+def test_unknown_document_and_op(client):
+    assert post(client, {"doc": 2, "start": 0, "end": 0, "lines": []})[0] == 409
+    assert post(client, {"doc": 1, "op": "run", "full": True}, "arm")[0] == 400
+
+@pytest.mark.parametrize("body", [[], "x", 3, None])
+def test_body_must_be_an_object(client, body):
+    assert post(client, body) == (400, {"error": "Body must be a JSON object"})
+
+def test_invalid_json(client):
+    response = client.post("/arm/incremental_api", data=b"{not json")
+    assert response.status_code == 400 and "error" in response.get_json()
+
+@pytest.mark.parametrize("positions", [{}, {"start": 0}, {"start": "0", "end": 1}, {"start": 0, "end": 1.5}, {"start": True, "end": 1}, {"start": None, "end": None}])
+def test_start_and_end_must_be_integers(client, positions):
+    post(client, {"doc": 1, "full": True, "lines": ["nop"]})
+    assert post(client, {"doc": 1, "lines": [], **positions}) == (400, {"error": "\"start\" and \"end\" must be integers"})
+
+@pytest.mark.parametrize("lines", ["nop", [1], {"a": "nop"}])
+def test_lines_must_be_strings(client, lines):
+    status, result = post(client, {"doc": 1, "full": True, "lines": lines})
+    assert status == 400 and "lines" in result["error"]
+
+def test_range_outside_of_the_document(client):
+    post(client, {"doc": 1, "full": True, "lines": ["nop"]})
+    status, result = post(client, {"doc": 1, "start": 0, "end": 5, "lines": []})
+    assert status == 400 and "outside" in result["error"]
+
+def test_request_size_limit(client):
+    assert client.post("/riscv/assemble_api", data=b"x"*(flask_server.MAX_REQUEST_BYTES+1)).status_code == 413
+
+def test_wsgi_app():
+    import wsgi
+    assert wsgi.app.test_client().post("/riscv/assemble_api", data="addi x1, x0, 1").get_data(as_text=True) == "93 00 10 00"
+
+def test_batch_routes(client):
+    jobs = [{"id": 1, "program": "addi x1, x0, 1"}, {"id": 2, "op": "disassemble", "program": "zz"}, "x"]
+    results = client.post("/riscv/batch", json=jobs).get_json()["results"]
+    assert [(result["id"], result["ok"], result.get("output")) for result in results] == [(1, True, "93 00 10 00"), (2, False, "_00: ERROR"), (None, False, None)]
+    assert client.post("/arm/batch", json={}).status_code == 400
+    assert client.post("/arm/batch", json=[{"id": 1, "program": "MOV r0, #1"}]).get_json() == \
+        {"results": [{"id": 1, "ok": True, "output": "01 00 A0 E3", "errors": []}]}
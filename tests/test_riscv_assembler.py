@@ -0,0 +1,116 @@
+import riscv.computer as R
+from riscv.helper_utils import expandLI
+
+def assemble(lines):
+    return list(R.riscv_assemble_lines(lines))
+
+# LI picks the shortest expansion
+
+def test_li_shortest_expansion():
+    assert expandLI("x1", 5) == ["ADDI x1, x0, 5"]
+    assert expandLI("x1", -2048) == ["ADDI x1, x0, -2048"]
+    assert expandLI("x1", 0x12345000) == ["LUI x1, 74565"]
+    assert expandLI("x1", 0x12345FFF) == ["LUI x1, 74566", "ADDI x1, x1, -1"]
+
+def test_li_unsigned_literals_of_negative_values():
+    assert expandLI("x1", 0xFFFFFFFF) == ["ADDI x1, x0, -1"]
+    assert expandLI("x1", 0xFFFFF800) == ["ADDI x1, x0, -2048"]
+    assert expandLI("x1", 0x80000000) == ["LUI x1, 524288"]
+    assert assemble(["li x1, 0xFFFFFFFF", "li x1, -1"]) == ["93 00 F0 FF"]*2
+
+def test_li_values_run_correctly():
+    for value in [0, 1, -1, 2047, 2048, -2049, 0x7FFFFFFF, 0x80000000, 0xFFFFF800, 0xFFFFF7FF, 0x12345FFF]:
+        comp = R.Computer(trace=R.TraceLevels.NONE)
+        comp.compile_from_assembly(f"li x5, {value}")
+        comp.run()
+        assert comp.RF[5] == value & 0xFFFFFFFF, hex(value)
+
+# Two-pass assembly: labels used before and after their definition
+
+LabelProgram = ["    j end", "loop: addi x1, x1, 1", "    beq x0, x0, loop", "end: nop  # done", "# comment only"]
+
+def test_forward_and_backward_labels():
+    words = [R.word2HexLine(R.RiscvIsa.encodeLine(line)) for line in ["jal x0, 12", "addi x1, x1, 1", "beq x0, x0, -4", "nop"]]
+    assert assemble(LabelProgram) == words + [""]
+
+def test_label_errors():
+    outputs, errors = R.riscv_assemble_checked(["a: nop", "a: nop", "beq x0, x0, nowhere"])
+    assert outputs == ["13 00 00 00", "ERROR", "ERROR"]
+    assert [(error.line, error.message) for error in errors] == [(2, "Label 'a' is already defined"), (3, "Unknown symbol 'nowhere'")]
+
+def test_hi_lo_of_data_labels():
+    comp = R.Computer(trace=R.TraceLevels.NONE)
+    comp.compile_from_assembly("""
+    lui  x1, %hi(n)
+    lw   x2, %lo(n)(x1)
+    lui  x3, %hi(n+0x12345800)
+    addi x3, x3, %lo(n+0x12345800)
+    .data
+pad: .word 1, 2
+n:   .word 42
+""")
+    comp.run()
+    assert comp.RF[2] == 42
+    assert comp.RF[3] == 8+0x12345800
+
+def test_streaming_matches_whole_program():
+    lines = LabelProgram + ["la x5, far", ".data", "far: .word end, later", ".text", "later: j loop"]
+    assert list(R.riscv_assemble_lines(iter(lines))) == assemble(lines) == R.riscv_assemble_program(lines).listing
+
+def test_streaming_waits_only_for_forward_references():
+    read = []
+    def source():
+        yield "j later"
+        for index in range(100):
+            read.append(index)
+            yield "nop"
+        yield "later: nop"
+        while True:
+            read.append(None)
+            yield "nop"
+    outputs = R.riscv_assemble_lines(source())
+    assert next(outputs) == R.word2HexLine(R.RiscvIsa.encodeLine("jal x0, 404"))
+    assert len(read) == 100  # Held until "later" was defined, nothing after it was read
+    assert [next(outputs) for _ in range(101)] == ["13 00 00 00"]*101
+
+# Incremental assembly, the listing after every edit is the one of the whole program
+
+def edited(program, client, start, end, lines):
+    first, stop, outputs = program.replace(start, end, lines)
+    client[first:stop] = outputs
+    return client
+
+def test_incremental_program_matches_whole_program():
+    lines = LabelProgram + ["la x5, far", ".data", "far: .word end, later", ".text", "later: j loop"]
+    program = R.IncrementalProgram(R.RiscvIsa)
+    client = edited(program, [], 0, 0, lines)
+    edits = [
+        (1, 1, ["li x1, 0x12345678"]),          # Moves every label after it
+        (2, 3, ["loop: addi x1, x1, 2"]),       # Same size, same label
+        (3, 4, ["back: beq x0, x0, later"]),    # Label renamed, "loop" is now unknown
+        (0, 0, ["loop: nop"]),                  # And defined again
+        (5, 5, ["end: nop"]),                   # Second definition of "end"
+        (4, 5, []),                             # The first one goes away, the second one counts now
+        (7, 8, [".text"]),                      # Every line after it changes section
+        (0, len(lines), ["nop"]*3),
+    ]
+    for start,end,new in edits:
+        lines[start:end] = new
+        assert edited(program, client, start, end, new) == program.listing == R.riscv_assemble_program(lines).listing
+
+def test_incremental_program_encodes_only_affected_lines():
+    lines = ["top: nop"] + ["addi x1, x1, 1"]*500 + ["beq x0, x0, top", "j bottom"] + ["nop"]*500 + ["bottom: nop"]
+    program = R.IncrementalProgram(R.RiscvIsa)
+    program.replace(0, 0, lines)
+    encoded = []
+    encode = program._encode
+    program._encode = lambda index: encoded.append(index) or encode(index)
+    lines[10] = "addi x2, x1, 1"
+    assert program.replace(10, 11, [lines[10]]) == (10, 11, ["13 81 10 00"])
+    assert encoded == [10]
+    # The branches after the new instruction are encoded again, only the one back over it changes
+    encoded.clear()
+    lines[300:300] = ["nop"]
+    assert program.replace(300, 300, ["nop"]) == (300, 502, program.listing[300:503])
+    assert sorted(encoded) == [300, 502, 503]
+    assert program.listing == R.riscv_assemble_program(lines).listing
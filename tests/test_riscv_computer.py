@@ -0,0 +1,64 @@
+import pytest
+
+from riscv.computer import Computer, Engines, TraceLevels
+
+Program = """
+    addi x1, x0, 10
+    addi x2, x0, 0
+loop:
+    add  x2, x2, x1
+    addi x1, x1, -1
+    bne  x1, x0, loop
+    sw   x2, 0(x0)
+"""
+
+def loaded(engine):
+    comp = Computer(engine=engine, trace=TraceLevels.NONE)
+    comp.compile_from_assembly(Program)
+    return comp
+
+@pytest.mark.parametrize("engine", [Engines.INTERPRETER, Engines.COMPILED, Engines.BLOCK])
+def test_engines_agree(engine):
+    comp = loaded(engine)
+    result = comp.run()
+    assert result.reason == "halt" and result.instructions == 33
+    assert comp.RF[2] == 55 and comp.readData(0) == 55
+
+@pytest.mark.parametrize("engine", [Engines.INTERPRETER, Engines.COMPILED, Engines.BLOCK])
+def test_snapshot_clone_write_restore(engine):
+    comp = loaded(engine)
+    comp.writeData(0, 17)
+    snapshot = comp.snapshot()
+    comp.clone()
+    comp.run()
+    comp.restore(snapshot)
+    assert comp.readData(0) == 17 and comp.RF[2] == 0
+    comp.resume()
+    assert comp.readData(0) == 55
+
+def test_fork_shares_until_written():
+    comp = loaded(Engines.COMPILED)
+    other = comp.fork()
+    assert other.DMem is comp.DMem
+    comp.run()
+    assert other.readData(0) == 0 and other.RF[2] == 0
+    other.writeInstruction(0, 0)
+    assert comp.IMem[0] != 0
+
+@pytest.mark.parametrize("engine", [Engines.COMPILED, Engines.BLOCK])
+def test_write_instruction_drops_compiled_code(engine):
+    comp = loaded(engine)
+    comp.run()
+    comp.writeInstruction(0, 0x00500093)  # addi x1, x0, 5
+    comp.run()
+    assert comp.RF[2] == 15
+
+def test_restore_of_other_program_drops_compiled_code():
+    comp = loaded(Engines.BLOCK)
+    snapshot = comp.snapshot()
+    comp.writeInstruction(0, 0x00500093)
+    comp.run()
+    assert comp.RF[2] == 15
+    comp.restore(snapshot)
+    comp.run()
+    assert comp.RF[2] == 55
@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import riscv.computer as R
+from riscv import vectorized
+
+Program = R.riscv_assemble_bytes("addi x1, x0, 1\nli x2, 0x12345678\nbeq x1, x2, -8\njal x0, 0")
+
+def test_same_output_as_the_scalar_disassembler():
+    words = Program + (0xFFFFFFFF).to_bytes(4, "little")  # Not an instruction
+    assert vectorized.disassemble_bytes(words) == R.riscv_disassemble_bytes(words)
+    assert vectorized.disassemble_bytes(memoryview(words)) == R.riscv_disassemble_bytes(words)
+
+@pytest.mark.parametrize("length", [1, 2, 3, 6])
+def test_length_not_a_multiple_of_4(length):
+    with pytest.raises(ValueError) as scalar:
+        R.riscv_disassemble_bytes(Program[:length])
+    with pytest.raises(ValueError) as vector:
+        vectorized.disassemble_bytes(Program[:length])
+    assert str(vector.value) == str(scalar.value) == f"Binary image length ({length} bytes) is not a multiple of 4"
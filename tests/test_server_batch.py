@@ -0,0 +1,56 @@
+import importlib
+import os
+import runpy
+
+import server_batch
+
+Environment = os.environ.get("BATCH_WORKERS")  # At collection, before any test ran
+
+GunicornConf = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+def reloaded(monkeypatch, value):
+    if(value is None):
+        monkeypatch.delenv("BATCH_WORKERS", raising=False)
+    else:
+        monkeypatch.setenv("BATCH_WORKERS", value)
+    return importlib.reload(server_batch)
+
+def test_batch_workers_default_and_override(monkeypatch):
+    try:
+        assert reloaded(monkeypatch, None).BATCH_WORKERS == (os.cpu_count() or 1)
+        assert reloaded(monkeypatch, "3").BATCH_WORKERS == 3
+    finally:
+        monkeypatch.undo()
+        importlib.reload(server_batch)
+
+def test_gunicorn_gives_every_worker_a_pool(monkeypatch):
+    monkeypatch.setenv("BATCH_WORKERS", "")  # Recorded, so the value gunicorn.conf.py sets is undone after the test
+    monkeypatch.delenv("BATCH_WORKERS")
+    conf = runpy.run_path(GunicornConf)
+    assert int(os.environ["BATCH_WORKERS"]) == max(2, (os.cpu_count() or 1) // conf["workers"])
+    monkeypatch.setenv("BATCH_WORKERS", "3")
+    runpy.run_path(GunicornConf)
+    assert os.environ["BATCH_WORKERS"] == "3"
+
+def test_gunicorn_conf_restores_environment():
+    # Runs after the test above, which must not leak BATCH_WORKERS into the rest of the session
+    assert os.environ.get("BATCH_WORKERS") == Environment
+
+def test_big_batches_use_the_pool(monkeypatch):
+    monkeypatch.setattr(server_batch, "BATCH_WORKERS", 2)
+    monkeypatch.setattr(server_batch, "_executor", None)
+    program = "\n".join(["addi x1, x0, 1"]*server_batch.BATCH_INLINE_LINES)
+    jobs = [{"id": index, "program": program} for index in range(3)]
+    try:
+        results = server_batch.run_batch_jobs("riscv", jobs)
+        assert server_batch._executor is not None
+    finally:
+        if(server_batch._executor is not None):
+            server_batch._executor.shutdown()
+    assert results == [server_batch.convert_job("riscv", job) for job in jobs]
+
+def test_batch_jobs_in_order():
+    jobs = [{"id": 1, "program": "addi x1, x0, 1"}, {"id": 2, "program": "bogus"}, "x"]
+    results = server_batch.run_batch_jobs("riscv", jobs)
+    assert [result["id"] for result in results] == [1, 2, None]
+    assert [result["ok"] for result in results] == [True, False, False]
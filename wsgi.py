@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+# WSGI entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+from flask_server import create_app
+
+app = create_app()